@@ -0,0 +1,172 @@
+"""
+SQLite FTS5 full-text indexes for entity text.
+
+Each entity table has an external-content FTS5 table (`<table>_fts`) over its
+text columns, kept in sync by triggers, so the text is stored once. Searches
+match every query term as a prefix and rank by bm25. The indexes are created by
+a schema migration on SQLite builds with FTS5; elsewhere (and before the
+migration) callers fall back to ILIKE.
+
+The base tables have string primary keys, so their rowids are implicit and a
+VACUUM may renumber them. The FTS tables are therefore keyed on a separate
+INTEGER column, search_rowid, which the insert trigger assigns and nothing
+else changes. It is SQLite-only and not part of the ORM models.
+"""
+
+import logging
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+from sqlalchemy import Connection, Select, column, literal_column, table, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+logger = logging.getLogger(__name__)
+
+# Entity type -> (base table, indexed text columns)
+FULLTEXT_COLUMNS: Dict[str, Tuple[str, Tuple[str, ...]]] = {
+    "notes": ("notes", ("content",)),
+    "tasks": ("tasks", ("description",)),
+    "topics": ("topics", ("name", "description")),
+    "people": ("people", ("name", "notes")),
+}
+
+# Stable FTS key on each base table (see the module docstring)
+SEARCH_ROWID = "search_rowid"
+
+_TERM = re.compile(r"\w+", re.UNICODE)
+
+# Databases known to have the FTS tables; a miss is re-checked on the next search
+_ready_databases: Set[str] = set()
+
+
+def _fts_name(entity_type: str) -> str:
+    return f"{FULLTEXT_COLUMNS[entity_type][0]}_fts"
+
+
+def fulltext_schema(entity_type: str) -> List[str]:
+    """DDL for an entity type's FTS table and the triggers that sync it"""
+    base, columns = FULLTEXT_COLUMNS[entity_type]
+    fts = _fts_name(entity_type)
+    names = ", ".join(columns)
+    new_values = ", ".join(f"new.{c}" for c in columns)
+    old_values = ", ".join(f"old.{c}" for c in columns)
+    delete_old = (
+        f"INSERT INTO {fts}({fts}, rowid, {names}) "
+        f"VALUES ('delete', old.{SEARCH_ROWID}, {old_values});"
+    )
+    insert_new = (
+        f"INSERT INTO {fts}(rowid, {names}) "
+        f"VALUES (new.{SEARCH_ROWID}, {new_values});"
+    )
+    # New rows take the next key; the row's own rowid is only used to find it
+    # again within the trigger
+    assign_key = (
+        f"UPDATE {base} SET {SEARCH_ROWID} = "
+        f"(SELECT coalesce(max({SEARCH_ROWID}), 0) + 1 FROM {base}) "
+        f"WHERE rowid = new.rowid;"
+    )
+    insert_assigned = (
+        f"INSERT INTO {fts}(rowid, {names}) "
+        f"SELECT {SEARCH_ROWID}, {names} FROM {base} WHERE rowid = new.rowid;"
+    )
+    return [
+        f"CREATE UNIQUE INDEX IF NOT EXISTS ix_{base}_{SEARCH_ROWID} "
+        f"ON {base} ({SEARCH_ROWID})",
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{names}, content='{base}', content_rowid='{SEARCH_ROWID}', "
+        f"tokenize='unicode61 remove_diacritics 2')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {base} "
+        f"BEGIN {assign_key} {insert_assigned} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {base} "
+        f"BEGIN {delete_old} END",
+        # Only text changes touch the index, so assigning the key does not
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {names} ON {base} "
+        f"BEGIN {delete_old} {insert_new} END",
+    ]
+
+
+def fts5_supported(conn: Connection) -> bool:
+    if conn.dialect.name != "sqlite":
+        return False
+    options = conn.execute(text("PRAGMA compile_options")).scalars().all()
+    return "ENABLE_FTS5" in options
+
+
+def _add_search_rowid(conn: Connection, base: str) -> None:
+    """Add and fill the stable key column on a base table that lacks it"""
+    existing = conn.execute(text(f"PRAGMA table_info({base})")).mappings()
+    if SEARCH_ROWID not in {row["name"] for row in existing}:
+        conn.execute(text(f"ALTER TABLE {base} ADD COLUMN {SEARCH_ROWID} INTEGER"))
+    # Current rowids are unique, so they make valid initial keys
+    conn.execute(
+        text(f"UPDATE {base} SET {SEARCH_ROWID} = rowid WHERE {SEARCH_ROWID} IS NULL")
+    )
+
+
+def create_fulltext_indexes(conn: Connection) -> None:
+    """Create the FTS tables and triggers and index existing rows (SQLite only)"""
+    if not fts5_supported(conn):
+        logger.info("FTS5 is not available; text search will use ILIKE")
+        return
+    for entity_type, (base, _) in FULLTEXT_COLUMNS.items():
+        _add_search_rowid(conn, base)
+        for statement in fulltext_schema(entity_type):
+            conn.execute(text(statement))
+    rebuild_fulltext_indexes(conn)
+
+
+def rebuild_fulltext_indexes(conn: Connection) -> None:
+    for entity_type in FULLTEXT_COLUMNS:
+        fts = _fts_name(entity_type)
+        conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+
+
+def contains_pattern(search: str) -> str:
+    """A LIKE pattern matching search literally anywhere, for escape="\\\\" """
+    escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def fulltext_query(search: str) -> Optional[str]:
+    """An FTS5 MATCH expression requiring every term of search as a prefix"""
+    terms = _TERM.findall(search)
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+async def fulltext_ready(db: AsyncSession) -> bool:
+    """Whether db has the FTS tables (SQLite with the migration applied)"""
+    bind = db.get_bind()
+    if bind.dialect.name != "sqlite":
+        return False
+    key = str(bind.engine.url)
+    if key in _ready_databases:
+        return True
+    try:
+        result = await db.execute(
+            text(
+                "SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = :name"
+            ),
+            {"name": _fts_name("notes")},
+        )
+    except OperationalError as e:
+        logger.warning(f"Could not check for full-text indexes: {str(e)}")
+        return False
+    if result.scalar():
+        _ready_databases.add(key)
+        return True
+    return False
+
+
+def apply_fulltext_match(
+    query: Select[Any], entity_type: str, match: str
+) -> Select[Any]:
+    """Restrict query to rows matching the FTS expression, best bm25 rank first"""
+    base, _ = FULLTEXT_COLUMNS[entity_type]
+    fts = table(_fts_name(entity_type), column("rowid"), column("rank"))
+    return (
+        query.join(fts, fts.c.rowid == literal_column(f"{base}.{SEARCH_ROWID}"))
+        .where(literal_column(fts.name).op("MATCH")(match))
+        .order_by(fts.c.rank)
+    )
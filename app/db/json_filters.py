@@ -0,0 +1,42 @@
+"""
+Dialect-aware filter on JSON array columns.
+
+On PostgreSQL the columns are JSONB and the filter compiles to containment
+(`column @> fragment`), which a GIN index on the column serves. On SQLite it
+compiles to json_each, so the same query works on either backend (the generic
+JSON `contains` is a LIKE on the serialized text there).
+"""
+
+import json
+from typing import Any
+from sqlalchemy import Boolean, literal
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.compiler import SQLCompiler
+from sqlalchemy.sql.functions import FunctionElement
+
+
+class json_array_contains(FunctionElement[bool]):
+    """column (a JSON array) has value as an element"""
+
+    type = Boolean()
+    inherit_cache = True
+    name = "json_array_contains"
+
+    def __init__(self, column: Any, value: Any) -> None:
+        super().__init__(column, literal(value), literal(json.dumps([value])))
+
+
+def _jsonb_containment(element: Any, compiler: SQLCompiler, **kw: Any) -> str:
+    clauses = list(element.clauses)
+    column = compiler.process(clauses[0], **kw)
+    fragment = compiler.process(clauses[-1], **kw)
+    return f"{column} @> CAST({fragment} AS JSONB)"
+
+
+@compiles(json_array_contains)
+def _compile_array_contains(element: Any, compiler: SQLCompiler, **kw: Any) -> str:
+    column, value, _ = (compiler.process(c, **kw) for c in element.clauses)
+    return f"EXISTS (SELECT 1 FROM json_each({column}) WHERE json_each.value = {value})"
+
+
+compiles(json_array_contains, "postgresql")(_jsonb_containment)
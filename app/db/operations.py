@@ -1,7 +1,34 @@
-from typing import List, Dict, Any, Optional
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
-from app.models import User, Person, Task, Topic, Note, SidekickThread
+from sqlalchemy import (
+    String,
+    cast,
+    func,
+    insert,
+    select,
+    delete,
+    update,
+    and_,
+    exists,
+    or_,
+)
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.attributes import set_committed_value
+from nanoid import generate
+from app.models import (
+    User,
+    Person,
+    Task,
+    Topic,
+    Note,
+    SidekickThread,
+    SidekickMessage,
+    SidekickJob,
+    BackgroundTask,
+)
 from app.schemas.sidekick_schema import (
     SidekickThreadCreate,
     PersonCreate,
@@ -9,8 +36,26 @@ from app.schemas.sidekick_schema import (
     TopicCreate,
     NoteCreate,
 )
+from app.core.config import settings
+from app.db.relationships import LINKS, link_statements, remap_references
+from app.db.fulltext import (
+    FULLTEXT_COLUMNS,
+    apply_fulltext_match,
+    contains_pattern,
+    fulltext_query,
+    fulltext_ready,
+)
+from utils.cache import (
+    ENTITY_COUNT_KEY,
+    bump_entity_version,
+    cache_delete_matching,
+    cache_get_json,
+    cache_set_json,
+    get_entity_version,
+)
 import uuid
 import logging
+from datetime import datetime, UTC
 
 logger = logging.getLogger(__name__)
 
@@ -73,6 +118,7 @@ async def create_person(db: AsyncSession, person: PersonCreate, user_id: str) ->
     db.add(db_person)
     await db.commit()
     await db.refresh(db_person)
+    await bump_entity_version(user_id)
     return db_person
 
 
@@ -90,14 +136,17 @@ async def update_person(
             setattr(person, key, value)
         await db.commit()
         await db.refresh(person)
+        await bump_entity_version(person.user_id)
     return person
 
 
 async def delete_person(db: AsyncSession, person_id: str) -> bool:
     person = await get_person(db, person_id)
     if person:
+        user_id = person.user_id
         await db.delete(person)
         await db.commit()
+        await bump_entity_version(user_id)
         return True
     return False
 
@@ -107,6 +156,19 @@ async def get_people_for_user(db: AsyncSession, user_id: str) -> List[Person]:
     return list(result.scalars().all())
 
 
+async def get_people_by_ids(
+    db: AsyncSession, user_id: str, person_ids: List[str]
+) -> List[Person]:
+    if not person_ids:
+        return []
+    result = await db.execute(
+        select(Person).filter(
+            Person.user_id == user_id, Person.person_id.in_(set(person_ids))
+        )
+    )
+    return list(result.scalars().all())
+
+
 # Task operations
 async def create_task(db: AsyncSession, task: TaskCreate, user_id: str) -> Task:
     task_data = task.model_dump()
@@ -115,6 +177,7 @@ async def create_task(db: AsyncSession, task: TaskCreate, user_id: str) -> Task:
     db.add(db_task)
     await db.commit()
     await db.refresh(db_task)
+    await bump_entity_version(user_id)
     return db_task
 
 
@@ -132,14 +195,17 @@ async def update_task(
             setattr(task, key, value)
         await db.commit()
         await db.refresh(task)
+        await bump_entity_version(task.user_id)
     return task
 
 
 async def delete_task(db: AsyncSession, task_id: str) -> bool:
     task = await get_task(db, task_id)
     if task:
+        user_id = task.user_id
         await db.delete(task)
         await db.commit()
+        await bump_entity_version(user_id)
         return True
     return False
 
@@ -149,6 +215,17 @@ async def get_tasks_for_user(db: AsyncSession, user_id: str) -> List[Task]:
     return list(result.scalars().all())
 
 
+async def get_tasks_by_ids(
+    db: AsyncSession, user_id: str, task_ids: List[str]
+) -> List[Task]:
+    if not task_ids:
+        return []
+    result = await db.execute(
+        select(Task).filter(Task.user_id == user_id, Task.task_id.in_(set(task_ids)))
+    )
+    return list(result.scalars().all())
+
+
 # Topic operations
 async def create_topic(db: AsyncSession, topic: TopicCreate, user_id: str) -> Topic:
     topic_data = topic.model_dump()
@@ -157,6 +234,7 @@ async def create_topic(db: AsyncSession, topic: TopicCreate, user_id: str) -> To
     db.add(db_topic)
     await db.commit()
     await db.refresh(db_topic)
+    await bump_entity_version(user_id)
     return db_topic
 
 
@@ -174,14 +252,17 @@ async def update_topic(
             setattr(topic, key, value)
         await db.commit()
         await db.refresh(topic)
+        await bump_entity_version(topic.user_id)
     return topic
 
 
 async def delete_topic(db: AsyncSession, topic_id: str) -> bool:
     topic = await get_topic(db, topic_id)
     if topic:
+        user_id = topic.user_id
         await db.delete(topic)
         await db.commit()
+        await bump_entity_version(user_id)
         return True
     return False
 
@@ -191,6 +272,19 @@ async def get_topics_for_user(db: AsyncSession, user_id: str) -> List[Topic]:
     return list(result.scalars().all())
 
 
+async def get_topics_by_ids(
+    db: AsyncSession, user_id: str, topic_ids: List[str]
+) -> List[Topic]:
+    if not topic_ids:
+        return []
+    result = await db.execute(
+        select(Topic).filter(
+            Topic.user_id == user_id, Topic.topic_id.in_(set(topic_ids))
+        )
+    )
+    return list(result.scalars().all())
+
+
 # Note operations
 async def create_note(db: AsyncSession, note: NoteCreate, user_id: str) -> Note:
     note_data = note.model_dump()
@@ -199,6 +293,7 @@ async def create_note(db: AsyncSession, note: NoteCreate, user_id: str) -> Note:
     db.add(db_note)
     await db.commit()
     await db.refresh(db_note)
+    await bump_entity_version(user_id)
     return db_note
 
 
@@ -216,14 +311,17 @@ async def update_note(
             setattr(note, key, value)
         await db.commit()
         await db.refresh(note)
+        await bump_entity_version(note.user_id)
     return note
 
 
 async def delete_note(db: AsyncSession, note_id: str) -> bool:
     note = await get_note(db, note_id)
     if note:
+        user_id = note.user_id
         await db.delete(note)
         await db.commit()
+        await bump_entity_version(user_id)
         return True
     return False
 
@@ -233,11 +331,272 @@ async def get_notes_for_user(db: AsyncSession, user_id: str) -> List[Note]:
     return list(result.scalars().all())
 
 
+async def get_notes_by_ids(
+    db: AsyncSession, user_id: str, note_ids: List[str]
+) -> List[Note]:
+    if not note_ids:
+        return []
+    result = await db.execute(
+        select(Note).filter(Note.user_id == user_id, Note.note_id.in_(set(note_ids)))
+    )
+    return list(result.scalars().all())
+
+
+# Bulk entity operations
+ENTITY_MODELS: Dict[str, Tuple[Any, str]] = {
+    "people": (Person, "person_id"),
+    "tasks": (Task, "task_id"),
+    "topics": (Topic, "topic_id"),
+    "notes": (Note, "note_id"),
+}
+
+
+async def get_entities_page(
+    db: AsyncSession,
+    entity_type: str,
+    user_id: str,
+    limit: int,
+    offset: int = 0,
+    after: Optional[str] = None,
+) -> Tuple[List[Any], bool]:
+    """
+    One page of the user's entities in id order and whether more follow: the
+    entities after id `after` (keyset), or from offset when no cursor is given.
+    """
+    model, id_field = ENTITY_MODELS[entity_type]
+    id_column = getattr(model, id_field)
+    query = select(model).where(model.user_id == user_id)
+    if after is not None:
+        query = query.where(id_column > after)
+    else:
+        query = query.offset(offset)
+    result = await db.execute(query.order_by(id_column).limit(limit + 1))
+    entities = list(result.scalars().all())
+    return entities[:limit], len(entities) > limit
+
+
+async def stream_entity_rows(
+    db: AsyncSession, entity_type: str, user_id: str, batch_size: int
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    A user's entities as column dicts in ID order, read through a server-side
+    cursor batch_size rows at a time (no ORM objects, so memory stays flat)
+    """
+    model, id_field = ENTITY_MODELS[entity_type]
+    table = model.__table__
+    result = await db.stream(
+        select(table)
+        .where(table.c.user_id == user_id)
+        .order_by(table.c[id_field])
+        .execution_options(yield_per=batch_size)
+    )
+    async for row in result.mappings():
+        yield dict(row)
+
+
+async def search_entities(
+    db: AsyncSession, entity_type: str, user_id: str, search: str, limit: int
+) -> List[Any]:
+    """
+    The user's entities whose text matches search, best first: FTS5 ranked by
+    bm25 when the index exists, otherwise ILIKE over the same columns.
+    """
+    model, _ = ENTITY_MODELS[entity_type]
+    query = select(model).where(model.user_id == user_id)
+    match = fulltext_query(search)
+    if match and await fulltext_ready(db):
+        query = apply_fulltext_match(query, entity_type, match)
+    else:
+        _, columns = FULLTEXT_COLUMNS[entity_type]
+        pattern = contains_pattern(search)
+        query = query.where(
+            or_(*(getattr(model, name).ilike(pattern, escape="\\") for name in columns))
+        )
+    result = await db.execute(query.limit(limit))
+    return list(result.scalars().all())
+
+
+async def count_entities_for_user(
+    db: AsyncSession, entity_type: str, user_id: str
+) -> int:
+    """The user's entity count, cached in Redis under the user's entity version"""
+    # Read the version first so a concurrent write can only orphan the cached count
+    version = await get_entity_version(user_id)
+    cache_key = None
+    if version is not None:
+        cache_key = ENTITY_COUNT_KEY.format(
+            user_id=user_id, entity_type=entity_type, version=version
+        )
+        cached = await cache_get_json(cache_key)
+        if isinstance(cached, int):
+            return cached
+
+    model, _ = ENTITY_MODELS[entity_type]
+    result = await db.execute(
+        select(func.count()).select_from(model).where(model.user_id == user_id)
+    )
+    total = result.scalar() or 0
+    if cache_key is not None:
+        await cache_set_json(cache_key, total, settings.SIDEKICK_COUNT_CACHE_TTL)
+    return total
+
+
+# Upsert passes per batch; see _upsert_rows
+UPSERT_ATTEMPTS = 2
+
+
+async def _upsert_rows(
+    db: AsyncSession, model: Any, id_field: str, rows: List[Dict[str, Any]]
+) -> Dict[str, Optional[str]]:
+    """
+    Insert or update rows by ID. Returns the IDs that changed: a row whose ID
+    another user took since the ownership check is skipped by the upsert, so it
+    is written again under a new ID, or maps to None if that is skipped too.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect not in ("sqlite", "postgresql"):
+        for row in rows:
+            await db.merge(model(**row))
+        return {}
+
+    # One cached statement run with executemany, rather than a multi-row
+    # VALUES clause compiled afresh for every batch
+    dialect_insert = sqlite_insert if dialect == "sqlite" else postgresql_insert
+    table = model.__table__
+    stmt = dialect_insert(table)
+    upsert = stmt.on_conflict_do_update(
+        index_elements=[id_field],
+        set_={
+            column.name: stmt.excluded[column.name]
+            for column in table.columns
+            if column.name not in (id_field, "user_id")
+        },
+        # Never overwrite a row another user inserted since the ownership check
+        where=table.c.user_id == stmt.excluded.user_id,
+    ).returning(table.c[id_field])
+
+    # (original ID, row) pairs; rows that lost their ID are retried once
+    pending = [(row[id_field], row) for row in rows]
+    written: List[Tuple[str, Dict[str, Any]]] = []
+    for attempt in range(UPSERT_ATTEMPTS):
+        result = await db.execute(upsert, [row for _, row in pending])
+        returned = set(result.scalars().all())
+        written += [(old, row) for old, row in pending if row[id_field] in returned]
+        pending = [(old, row) for old, row in pending if row[id_field] not in returned]
+        if not pending:
+            break
+        if attempt < UPSERT_ATTEMPTS - 1:
+            pending = [
+                (old, {**row, id_field: generate(size=8)}) for old, row in pending
+            ]
+
+    renamed: Dict[str, Optional[str]] = {
+        old: row[id_field] for old, row in written if row[id_field] != old
+    }
+    for old, row in pending:
+        logger.warning(f"{model.__tablename__} {old} was taken by another user")
+        renamed[old] = None
+
+    # Keep entities already loaded in this session in sync with the new values
+    for _, row in written:
+        loaded = db.identity_map.get(db.identity_key(model, row[id_field]))
+        if loaded is not None:
+            for key, value in row.items():
+                set_committed_value(loaded, key, value)
+    return renamed
+
+
+async def upsert_entity_rows(
+    db: AsyncSession,
+    user_id: str,
+    rows_by_type: Dict[str, List[Dict[str, Any]]],
+    renamed_ids: Optional[Dict[str, Dict[str, str]]] = None,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Insert or update people, tasks, topics and notes for one user in a single
+    transaction: one ownership query and one upsert per entity type, one commit.
+
+    Rows sharing an ID collapse to the last of them. Rows with an empty ID or an
+    ID owned by another user get a new ID, recorded in renamed_ids (entity type
+    -> old ID -> new ID); references to a renamed ID in the rows of this call,
+    or of a later call given the same renamed_ids, are rewritten to the new ID.
+    Returns the stored column dicts, one per ID in input order, keyed by entity
+    type; a row is left out only if it could not be saved under any ID (see
+    _upsert_rows).
+    """
+    if renamed_ids is None:
+        renamed_ids = {}
+    saved: Dict[str, List[Dict[str, Any]]] = {}
+    for entity_type, rows in rows_by_type.items():
+        if not rows:
+            continue
+        model, id_field = ENTITY_MODELS[entity_type]
+        id_column = getattr(model, id_field)
+
+        # Later rows with the same ID win, as with sequential updates
+        latest = {row[id_field]: row for row in rows if row.get(id_field)}
+        rows = [row for row in rows if latest.get(row.get(id_field), row) is row]
+        owners: Dict[str, str] = {}
+        if latest:
+            result = await db.execute(
+                select(id_column, model.user_id).where(id_column.in_(latest))
+            )
+            owners = {entity_id: owner for entity_id, owner in result.all()}
+
+        renames = renamed_ids.setdefault(entity_type, {})
+        pending: List[Tuple[Optional[str], Dict[str, Any]]] = []
+        for row in rows:
+            row = {**row, "user_id": user_id}
+            entity_id = row.get(id_field)
+            if not entity_id or owners.get(entity_id, user_id) != user_id:
+                row[id_field] = generate(size=8)
+                if entity_id:
+                    renames[entity_id] = row[id_field]
+            pending.append((entity_id, row))
+        pending = [
+            (entity_id, remap_references(entity_type, row, renamed_ids))
+            for entity_id, row in pending
+        ]
+
+        renamed = await _upsert_rows(db, model, id_field, [row for _, row in pending])
+        rows_saved = []
+        for entity_id, row in pending:
+            new_id = renamed.get(row[id_field], row[id_field])
+            if entity_id and new_id != entity_id:
+                if new_id is None:
+                    renames.pop(entity_id, None)
+                else:
+                    renames[entity_id] = new_id
+            if new_id is not None:
+                row[id_field] = new_id
+                rows_saved.append(row)
+        saved[entity_type] = rows_saved
+        # The Core upsert bypasses the mapper events that maintain the link tables
+        for statement, parameters in link_statements(entity_type, rows_saved):
+            await db.execute(statement, parameters)
+
+    if saved:
+        await db.commit()
+        await bump_entity_version(user_id)
+    return saved
+
+
+async def bulk_upsert_entities(
+    db: AsyncSession, user_id: str, rows_by_type: Dict[str, List[Dict[str, Any]]]
+) -> Dict[str, List[Any]]:
+    """upsert_entity_rows, returning transient model instances"""
+    saved = await upsert_entity_rows(db, user_id, rows_by_type)
+    return {
+        entity_type: [ENTITY_MODELS[entity_type][0](**row) for row in rows]
+        for entity_type, rows in saved.items()
+    }
+
+
 # SidekickThread operations
 async def create_sidekick_thread(
-    db: AsyncSession, thread: SidekickThreadCreate
+    db: AsyncSession, thread: SidekickThreadCreate, thread_id: Optional[str] = None
 ) -> SidekickThread:
-    db_thread = SidekickThread(**thread.model_dump(), id=str(uuid.uuid4()))
+    db_thread = SidekickThread(**thread.model_dump(), id=thread_id or str(uuid.uuid4()))
     db.add(db_thread)
     await db.commit()
     await db.refresh(db_thread)
@@ -247,8 +606,12 @@ async def create_sidekick_thread(
 async def get_sidekick_thread(
     db: AsyncSession, thread_id: str
 ) -> Optional[SidekickThread]:
+    # Always reload: another request may have appended to the history since
+    # this session last loaded the thread
     result = await db.execute(
-        select(SidekickThread).filter(SidekickThread.id == thread_id)
+        select(SidekickThread)
+        .filter(SidekickThread.id == thread_id)
+        .execution_options(populate_existing=True)
     )
     return result.scalars().first()
 
@@ -267,17 +630,440 @@ async def update_sidekick_thread(
 async def delete_sidekick_thread(db: AsyncSession, thread_id: str) -> bool:
     thread = await get_sidekick_thread(db, thread_id)
     if thread:
+        await db.execute(
+            delete(SidekickMessage).where(SidekickMessage.thread_id == thread_id)
+        )
         await db.delete(thread)
         await db.commit()
         return True
     return False
 
 
+# SidekickMessage operations
+async def get_next_message_seq(db: AsyncSession, thread_id: str) -> int:
+    result = await db.execute(
+        select(func.max(SidekickMessage.seq)).where(
+            SidekickMessage.thread_id == thread_id
+        )
+    )
+    last_seq = result.scalar()
+    return 0 if last_seq is None else last_seq + 1
+
+
+async def _insert_sidekick_messages(
+    db: AsyncSession, thread_id: str, messages: List[Dict[str, Any]], start_seq: int
+) -> None:
+    """Insert messages at start_seq onwards; a taken seq raises IntegrityError"""
+    now = datetime.now(UTC).isoformat()
+    rows = [
+        {
+            "thread_id": thread_id,
+            "seq": start_seq + offset,
+            "role": message["role"],
+            "content": str(message["content"]),
+            "token_count": message.get("token_count"),
+            "created_at": now,
+        }
+        for offset, message in enumerate(messages)
+    ]
+    await db.execute(insert(SidekickMessage), rows)
+
+
+async def _is_stored_at(
+    db: AsyncSession, thread_id: str, messages: List[Dict[str, Any]], start_seq: int
+) -> bool:
+    """Whether the thread already holds exactly these messages from start_seq"""
+    result = await db.execute(
+        select(SidekickMessage.role, SidekickMessage.content)
+        .where(
+            SidekickMessage.thread_id == thread_id,
+            SidekickMessage.seq >= start_seq,
+            SidekickMessage.seq < start_seq + len(messages),
+        )
+        .order_by(SidekickMessage.seq)
+    )
+    stored = [(role, content) for role, content in result.all()]
+    return stored == [(m["role"], str(m["content"])) for m in messages]
+
+
+# Appends tried before giving up when concurrent appends keep taking the seqs
+APPEND_ATTEMPTS = 3
+
+
+async def append_sidekick_messages(
+    db: AsyncSession,
+    thread_id: str,
+    messages: List[Dict[str, Any]],
+    start_seq: Optional[int] = None,
+) -> int:
+    """
+    Append messages to a thread and return the next free seq. start_seq is where
+    the caller expects them: if those positions already hold the same messages
+    the append is a replay and stores nothing, and if another append took them
+    the messages go after it instead.
+    """
+    if start_seq is not None and await _is_stored_at(
+        db, thread_id, messages, start_seq
+    ):
+        return start_seq + len(messages)
+    if not messages:
+        return await get_next_message_seq(db, thread_id)
+
+    seq = await get_next_message_seq(db, thread_id) if start_seq is None else start_seq
+    attempt = 1
+    while True:
+        try:
+            async with db.begin_nested():
+                await _insert_sidekick_messages(db, thread_id, messages, seq)
+            break
+        except IntegrityError:
+            if attempt >= APPEND_ATTEMPTS:
+                raise
+            logger.warning(f"Seq {seq} of thread {thread_id} was taken, retrying")
+            attempt += 1
+            seq = await get_next_message_seq(db, thread_id)
+    await db.commit()
+    return seq + len(messages)
+
+
+async def get_sidekick_messages(
+    db: AsyncSession, thread_id: str, limit: Optional[int] = None
+) -> List[SidekickMessage]:
+    """The thread's last limit messages (all when None), oldest first"""
+    query = (
+        select(SidekickMessage)
+        .where(SidekickMessage.thread_id == thread_id)
+        .order_by(SidekickMessage.seq.desc())
+    )
+    if limit is not None:
+        query = query.limit(limit)
+    result = await db.execute(query)
+    return list(reversed(result.scalars().all()))
+
+
+async def get_sidekick_messages_between(
+    db: AsyncSession, thread_id: str, start_seq: int, end_seq: int
+) -> List[SidekickMessage]:
+    """The thread's messages with start_seq <= seq < end_seq, oldest first"""
+    result = await db.execute(
+        select(SidekickMessage)
+        .where(
+            SidekickMessage.thread_id == thread_id,
+            SidekickMessage.seq >= start_seq,
+            SidekickMessage.seq < end_seq,
+        )
+        .order_by(SidekickMessage.seq)
+    )
+    return list(result.scalars().all())
+
+
+async def update_thread_summary(
+    db: AsyncSession, thread: SidekickThread, summary: str, summary_seq: int
+) -> None:
+    """Store a thread's rolling summary of the messages before summary_seq"""
+    thread.history_summary = summary
+    thread.summary_seq = summary_seq
+    await db.commit()
+
+
+async def get_sidekick_messages_page(
+    db: AsyncSession,
+    thread_id: str,
+    limit: int,
+    before: Optional[int] = None,
+    after: Optional[int] = None,
+) -> Tuple[List[SidekickMessage], bool]:
+    """
+    One page of a thread's messages, oldest first, and whether more exist past
+    it: the latest limit messages before seq `before` (or overall), or the
+    earliest limit messages after seq `after`.
+    """
+    query = select(SidekickMessage).where(SidekickMessage.thread_id == thread_id)
+    if after is not None:
+        query = query.where(SidekickMessage.seq > after).order_by(SidekickMessage.seq)
+    else:
+        if before is not None:
+            query = query.where(SidekickMessage.seq < before)
+        query = query.order_by(SidekickMessage.seq.desc())
+    result = await db.execute(query.limit(limit + 1))
+    messages = list(result.scalars().all())
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if after is None:
+        messages.reverse()
+    return messages, has_more
+
+
+async def get_sidekick_thread_summaries(
+    db: AsyncSession, user_id: str, offset: int, limit: int
+) -> Tuple[List[Tuple[str, int, Optional[str]]], int]:
+    """
+    (thread id, message count, last message time) for a page of the user's
+    threads, most recently active first, and the user's thread count. The
+    history columns themselves are never loaded.
+    """
+    last_message_at = func.max(SidekickMessage.created_at)
+    result = await db.execute(
+        select(
+            SidekickThread.id,
+            func.count(SidekickMessage.id),
+            last_message_at,
+        )
+        .outerjoin(SidekickMessage, SidekickMessage.thread_id == SidekickThread.id)
+        .where(SidekickThread.user_id == user_id)
+        .group_by(SidekickThread.id)
+        .order_by(last_message_at.desc().nulls_last(), SidekickThread.id)
+        .offset(offset)
+        .limit(limit)
+    )
+    total = await db.execute(
+        select(func.count(SidekickThread.id)).where(SidekickThread.user_id == user_id)
+    )
+    summaries = [(row[0], row[1], row[2]) for row in result.all()]
+    return summaries, total.scalar() or 0
+
+
+async def migrate_thread_history(db: AsyncSession, thread: SidekickThread) -> int:
+    """Move a thread's legacy JSON history into sidekick_messages"""
+    history = thread.conversation_history or []
+    if not history:
+        return 0
+    # The legacy history precedes appended messages, so it belongs at seq 0..n-1;
+    # if the thread somehow has messages there already it goes after them
+    await append_sidekick_messages(db, thread.id, history, 0)
+    thread.conversation_history = []
+    await db.commit()
+    return len(history)
+
+
+async def migrate_all_thread_histories(db: AsyncSession) -> int:
+    """Migrate every thread that still has a legacy history blob"""
+    result = await db.execute(
+        select(SidekickThread).where(
+            cast(SidekickThread.conversation_history, String) != "[]"
+        )
+    )
+    migrated = 0
+    for thread in result.scalars().all():
+        migrated += await migrate_thread_history(db, thread)
+    return migrated
+
+
+# SidekickJob operations
+async def create_sidekick_job(
+    db: AsyncSession, user_id: str, request: Dict[str, Any]
+) -> SidekickJob:
+    now = datetime.now(UTC).isoformat()
+    job = SidekickJob(
+        user_id=user_id,
+        status="pending",
+        request=request,
+        created_at=now,
+        updated_at=now,
+    )
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    return job
+
+
+async def get_sidekick_job(db: AsyncSession, job_id: str) -> Optional[SidekickJob]:
+    result = await db.execute(
+        select(SidekickJob)
+        .filter(SidekickJob.id == job_id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
+
+
+async def claim_sidekick_job(db: AsyncSession, job_id: str, stale_before: str) -> bool:
+    """
+    Atomically mark a job running. Pending jobs, and running jobs whose worker
+    stopped updating them before stale_before, can be claimed; anything else
+    belongs to another worker or is finished.
+    """
+    result = await db.execute(
+        update(SidekickJob)
+        .where(
+            SidekickJob.id == job_id,
+            or_(
+                SidekickJob.status == "pending",
+                and_(
+                    SidekickJob.status == "running",
+                    SidekickJob.updated_at < stale_before,
+                ),
+            ),
+        )
+        .values(status="running", updated_at=datetime.now(UTC).isoformat())
+    )
+    await db.commit()
+    return bool(result.rowcount)
+
+
+async def update_sidekick_job(
+    db: AsyncSession,
+    job_id: str,
+    status: str,
+    result: Optional[Dict[str, Any]] = None,
+    error: Optional[str] = None,
+) -> Optional[SidekickJob]:
+    job = await get_sidekick_job(db, job_id)
+    if job:
+        job.status = status
+        job.result = result
+        job.error = error
+        job.updated_at = datetime.now(UTC).isoformat()
+        await db.commit()
+        await db.refresh(job)
+    return job
+
+
+async def touch_sidekick_job(db: AsyncSession, job_id: str) -> None:
+    """Heartbeat for a running job, so it is not reclaimed as stale"""
+    await db.execute(
+        update(SidekickJob)
+        .where(SidekickJob.id == job_id, SidekickJob.status == "running")
+        .values(updated_at=datetime.now(UTC).isoformat())
+    )
+    await db.commit()
+
+
+async def get_unfinished_sidekick_jobs(
+    db: AsyncSession, stale_before: Optional[str] = None
+) -> List[SidekickJob]:
+    """Pending and running jobs; with stale_before, only those not updated since"""
+    query = select(SidekickJob).filter(SidekickJob.status.in_(("pending", "running")))
+    if stale_before is not None:
+        query = query.filter(SidekickJob.updated_at < stale_before)
+    result = await db.execute(query.order_by(SidekickJob.created_at))
+    return list(result.scalars().all())
+
+
+# BackgroundTask operations
+async def create_background_task(
+    db: AsyncSession,
+    kind: str,
+    payload: Dict[str, Any],
+    group_key: Optional[str] = None,
+) -> BackgroundTask:
+    now = datetime.now(UTC).isoformat()
+    task = BackgroundTask(
+        kind=kind,
+        group_key=group_key,
+        payload=payload,
+        status="pending",
+        attempts=0,
+        created_at=now,
+        updated_at=now,
+    )
+    db.add(task)
+    await db.commit()
+    return task
+
+
+async def get_background_task(
+    db: AsyncSession, task_id: str
+) -> Optional[BackgroundTask]:
+    result = await db.execute(
+        select(BackgroundTask)
+        .filter(BackgroundTask.id == task_id)
+        .execution_options(populate_existing=True)
+    )
+    return result.scalars().first()
+
+
+async def claim_background_task(
+    db: AsyncSession, task_id: str, stale_before: str
+) -> bool:
+    """
+    Atomically mark a task running and count the attempt. Pending tasks, and
+    running tasks whose worker stopped before stale_before, can be claimed, but
+    only while no other task of their group is running and none was queued
+    before them, so a group's tasks run one at a time and in order.
+    """
+    other = aliased(BackgroundTask)
+    blocked = exists().where(
+        other.group_key == BackgroundTask.group_key,
+        other.id != BackgroundTask.id,
+        or_(
+            and_(other.status == "running", other.updated_at >= stale_before),
+            and_(
+                other.status == "pending", other.created_at < BackgroundTask.created_at
+            ),
+        ),
+    )
+    result = await db.execute(
+        update(BackgroundTask)
+        .where(
+            BackgroundTask.id == task_id,
+            or_(
+                BackgroundTask.status == "pending",
+                and_(
+                    BackgroundTask.status == "running",
+                    BackgroundTask.updated_at < stale_before,
+                ),
+            ),
+            ~blocked,
+        )
+        .values(
+            status="running",
+            attempts=BackgroundTask.attempts + 1,
+            updated_at=datetime.now(UTC).isoformat(),
+        )
+    )
+    await db.commit()
+    return bool(result.rowcount)
+
+
+async def release_background_task(
+    db: AsyncSession, task_id: str, status: str, error: str
+) -> None:
+    """Return a failed task to pending for a retry, or mark it failed"""
+    await db.execute(
+        update(BackgroundTask)
+        .where(BackgroundTask.id == task_id)
+        .values(status=status, error=error, updated_at=datetime.now(UTC).isoformat())
+    )
+    await db.commit()
+
+
+async def delete_background_task(
+    db: AsyncSession, task_id: str, commit: bool = True
+) -> None:
+    """Delete a finished task; commit=False leaves it to the caller's transaction"""
+    await db.execute(delete(BackgroundTask).where(BackgroundTask.id == task_id))
+    if commit:
+        await db.commit()
+
+
+async def get_unfinished_background_tasks(
+    db: AsyncSession, group_key: Optional[str] = None
+) -> List[BackgroundTask]:
+    query = select(BackgroundTask).filter(
+        BackgroundTask.status.in_(("pending", "running"))
+    )
+    if group_key is not None:
+        query = query.filter(BackgroundTask.group_key == group_key)
+    result = await db.execute(
+        query.order_by(BackgroundTask.created_at).execution_options(
+            populate_existing=True
+        )
+    )
+    return list(result.scalars().all())
+
+
 # Database purge operation
 async def purge_database(db: AsyncSession) -> None:
+    for links in LINKS.values():
+        for link in links:
+            await db.execute(delete(link.table))
     await db.execute(delete(Person))
     await db.execute(delete(Task))
     await db.execute(delete(Topic))
     await db.execute(delete(Note))
+    await db.execute(delete(SidekickMessage))
     await db.execute(delete(SidekickThread))
+    await db.execute(delete(SidekickJob))
+    await db.execute(delete(BackgroundTask))
     await db.commit()
+    await cache_delete_matching("sidekick:*")
@@ -0,0 +1,213 @@
+"""
+Junction tables mirroring the JSON relationship fields.
+
+Notes, topics and tasks keep their related IDs in JSON columns, which the API
+returns unchanged. Each field is also written to a link table (see
+app/models.py) with a (user_id, target, source) index, so "which notes mention
+this person" is an index seek rather than a scan over every JSON array.
+
+The links follow ORM inserts, deletes and updates that change a relationship
+field through mapper events; Core statements that bypass the ORM (bulk upserts,
+bulk deletes) must call link_statements / unlink_statement themselves.
+"""
+
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from sqlalchemy import (
+    Connection,
+    Executable,
+    Select,
+    Table,
+    delete,
+    event,
+    inspect,
+    select,
+)
+from app.models import (
+    Note,
+    Task,
+    Topic,
+    note_people,
+    note_tasks,
+    note_topics,
+    task_people,
+    topic_people,
+    topic_tasks,
+)
+
+
+class Link(NamedTuple):
+    field: str  # JSON field on the source entity
+    table: Table
+    source: str  # source ID column (also the entity's ID attribute)
+    target: str
+
+
+# Entity type -> the links written from its JSON fields
+LINKS: Dict[str, Tuple[Link, ...]] = {
+    "notes": (
+        Link("related_people", note_people, "note_id", "person_id"),
+        Link("related_tasks", note_tasks, "note_id", "task_id"),
+        Link("related_topics", note_topics, "note_id", "topic_id"),
+    ),
+    "topics": (
+        Link("related_people", topic_people, "topic_id", "person_id"),
+        Link("related_tasks", topic_tasks, "topic_id", "task_id"),
+    ),
+    "tasks": (Link("people", task_people, "task_id", "person_id"),),
+}
+
+LINKED_MODELS = {"notes": Note, "topics": Topic, "tasks": Task}
+
+# Task people roles -> keys of Task.people
+TASK_ROLES = {
+    "owner": "owner",
+    "final_beneficiary": "final_beneficiary",
+    "stakeholder": "stakeholders",
+}
+
+
+# Link target column -> the entity type it refers to
+TARGET_TYPES = {"person_id": "people", "task_id": "tasks", "topic_id": "topics"}
+
+
+def _ids(value: Any) -> List[str]:
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list):
+        return []
+    return list(dict.fromkeys(v for v in value if isinstance(v, str) and v))
+
+
+def link_rows(link: Link, row: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """The link table rows for one entity row"""
+    base = {link.source: row[link.source], "user_id": row["user_id"]}
+    value = row.get(link.field)
+    if link.table is task_people:
+        people = value if isinstance(value, dict) else {}
+        return [
+            {**base, link.target: person_id, "role": role}
+            for role, key in TASK_ROLES.items()
+            for person_id in _ids(people.get(key))
+        ]
+    return [{**base, link.target: target_id} for target_id in _ids(value)]
+
+
+def _remap(value: Any, ids: Dict[str, str]) -> Any:
+    if isinstance(value, str):
+        return ids.get(value, value)
+    if isinstance(value, list):
+        return [ids.get(v, v) if isinstance(v, str) else v for v in value]
+    return value
+
+
+def remap_references(
+    entity_type: str, row: Dict[str, Any], renamed: Dict[str, Dict[str, str]]
+) -> Dict[str, Any]:
+    """
+    row with the IDs in its relationship fields (and task dependencies) replaced
+    per renamed, which maps entity type -> old ID -> new ID
+    """
+    row = dict(row)
+    for link in LINKS.get(entity_type, ()):
+        ids = renamed.get(TARGET_TYPES[link.target])
+        if not ids or link.field not in row:
+            continue
+        value = row[link.field]
+        if link.table is task_people and isinstance(value, dict):
+            row[link.field] = {key: _remap(v, ids) for key, v in value.items()}
+        else:
+            row[link.field] = _remap(value, ids)
+    if entity_type == "tasks" and renamed.get("tasks") and "dependencies" in row:
+        row["dependencies"] = _remap(row["dependencies"], renamed["tasks"])
+    return row
+
+
+def unlink_statement(link: Link, source_ids: List[str]) -> Executable:
+    return delete(link.table).where(link.table.c[link.source].in_(source_ids))
+
+
+def link_statements(
+    entity_type: str, rows: List[Dict[str, Any]]
+) -> Iterator[Tuple[Executable, Optional[List[Dict[str, Any]]]]]:
+    """(statement, parameters) pairs replacing the links of rows"""
+    for link in LINKS.get(entity_type, ()):
+        yield unlink_statement(link, [row[link.source] for row in rows]), None
+        new_rows = [new for row in rows for new in link_rows(link, row)]
+        if new_rows:
+            yield link.table.insert(), new_rows
+
+
+def sync_links(conn: Connection, entity_type: str, rows: List[Dict[str, Any]]) -> None:
+    for statement, parameters in link_statements(entity_type, rows):
+        conn.execute(statement, parameters)
+
+
+def linked_source_ids(
+    entity_type: str,
+    field: str,
+    user_id: str,
+    target_id: str,
+    role: Optional[str] = None,
+) -> Select[Any]:
+    """
+    Subquery of the IDs of user_id's entities whose field contains target_id;
+    role narrows task people to owner, final_beneficiary or stakeholder.
+    """
+    link = next(link for link in LINKS[entity_type] if link.field == field)
+    table = link.table
+    query = select(table.c[link.source]).where(
+        table.c.user_id == user_id, table.c[link.target] == target_id
+    )
+    if role is not None:
+        query = query.where(table.c.role == role)
+    return query
+
+
+def backfill_links(conn: Connection, batch_size: int = 500) -> None:
+    """Rebuild every link table from the JSON fields of the existing entities"""
+    for entity_type, links in LINKS.items():
+        for link in links:
+            link.table.create(bind=conn, checkfirst=True)
+            conn.execute(link.table.delete())
+        table = inspect(LINKED_MODELS[entity_type]).local_table
+        columns = [table.c[links[0].source], table.c.user_id]
+        columns += [table.c[link.field] for link in links]
+        result = conn.execute(select(*columns))
+        for batch in result.mappings().partitions(batch_size):
+            rows = [dict(row) for row in batch]
+            for link in links:
+                new_rows = [new for row in rows for new in link_rows(link, row)]
+                if new_rows:
+                    conn.execute(link.table.insert(), new_rows)
+
+
+def _entity_row(entity_type: str, target: Any) -> Dict[str, Any]:
+    row = {"user_id": target.user_id}
+    for link in LINKS[entity_type]:
+        row[link.source] = getattr(target, link.source)
+        row[link.field] = getattr(target, link.field)
+    return row
+
+
+def _register(entity_type: str) -> None:
+    model = LINKED_MODELS[entity_type]
+
+    @event.listens_for(model, "after_insert")
+    def _link(mapper: Any, connection: Connection, target: Any) -> None:
+        sync_links(connection, entity_type, [_entity_row(entity_type, target)])
+
+    @event.listens_for(model, "after_update")
+    def _relink(mapper: Any, connection: Connection, target: Any) -> None:
+        # Most updates leave the relationship fields alone
+        attrs = inspect(target).attrs
+        if any(attrs[link.field].history.has_changes() for link in LINKS[entity_type]):
+            sync_links(connection, entity_type, [_entity_row(entity_type, target)])
+
+    @event.listens_for(model, "after_delete")
+    def _unlink(mapper: Any, connection: Connection, target: Any) -> None:
+        for link in LINKS[entity_type]:
+            connection.execute(unlink_statement(link, [getattr(target, link.source)]))
+
+
+for _entity_type in LINKED_MODELS:
+    _register(_entity_type)
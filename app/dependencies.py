@@ -1,11 +1,13 @@
-from fastapi import Depends, HTTPException, status, WebSocket, Query
+from fastapi import Depends, HTTPException, status, WebSocket, Query, Request
 from fastapi.security import OAuth2PasswordBearer
 from app.services.storage_service import StorageService
+from app.services.llm_client import LLMClient, get_shared_llm_client
+from app.services.sidekick_jobs import SidekickJobQueue
 from app.models import User
 from utils.token import verify_token
 from sqlalchemy.ext.asyncio import AsyncSession
 from utils.database import get_db
-from typing import Optional
+from typing import Optional, cast
 from fastapi import UploadFile
 from jose import JWTError, jwt
 from app.core.config import settings
@@ -111,6 +113,31 @@ def get_storage_service() -> StorageService:
     return MinioStorageService(config)
 
 
+def get_llm_client(request: Request) -> LLMClient:
+    """
+    Dependency to provide the app-lifetime LLM client stored on app.state.
+    """
+    llm_client = getattr(request.app.state, "llm_client", None)
+    if llm_client is None:
+        return get_shared_llm_client()
+    return cast(LLMClient, llm_client)
+
+
+def get_job_queue(request: Request) -> SidekickJobQueue:
+    """
+    Dependency to provide the Sidekick job queue stored on app.state, creating it
+    on first use when startup hooks have not run.
+    """
+    job_queue = getattr(request.app.state, "sidekick_jobs", None)
+    if job_queue is None:
+        job_queue = SidekickJobQueue(
+            get_llm_client(request),
+            getattr(request.app.state, "websocket_manager", None),
+        )
+        request.app.state.sidekick_jobs = job_queue
+    return cast(SidekickJobQueue, job_queue)
+
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)
 ) -> UserInfo:
@@ -1,11 +1,35 @@
 import uuid
-from sqlalchemy import String, ForeignKey, JSON, Enum
+from sqlalchemy import (
+    Column,
+    String,
+    ForeignKey,
+    Index,
+    Integer,
+    JSON,
+    Enum,
+    Table,
+    Text,
+)
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import declarative_base, relationship, Mapped, mapped_column
 from typing import List, Dict, Any, Optional
 from nanoid import generate
 
 Base: Any = declarative_base()
 
+# JSON on SQLite, JSONB on PostgreSQL (containment operators, GIN indexes)
+JSONType = JSON().with_variant(JSONB(), "postgresql")
+
+
+def gin_index(name: str, column: str) -> Index:
+    """GIN index for JSONB containment filters; only created on PostgreSQL"""
+    return Index(
+        name,
+        column,
+        postgresql_using="gin",
+        postgresql_ops={column: "jsonb_path_ops"},
+    ).ddl_if(dialect="postgresql")
+
 
 class User(Base):
     __tablename__ = "users"
@@ -41,6 +65,10 @@ class User(Base):
 
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        Index("ix_tasks_user_status_priority", "user_id", "status", "priority"),
+        Index("ix_tasks_user_task_id", "user_id", "task_id"),
+    )
 
     task_id: Mapped[str] = mapped_column(
         String, primary_key=True, default=lambda: generate(size=8)
@@ -51,9 +79,9 @@ class Task(Base):
     status: Mapped[str] = mapped_column(
         Enum("active", "pending", "completed", name="task_status_enum")
     )
-    actions: Mapped[List[str]] = mapped_column(JSON)
-    people: Mapped[Dict[str, Any]] = mapped_column(JSON)
-    dependencies: Mapped[List[str]] = mapped_column(JSON)
+    actions: Mapped[List[str]] = mapped_column(JSONType)
+    people: Mapped[Dict[str, Any]] = mapped_column(JSONType)
+    dependencies: Mapped[List[str]] = mapped_column(JSONType)
     schedule: Mapped[str] = mapped_column(String)
     priority: Mapped[str] = mapped_column(
         Enum("high", "medium", "low", name="priority_enum")
@@ -67,6 +95,10 @@ class Task(Base):
 
 class Person(Base):
     __tablename__ = "people"
+    __table_args__ = (
+        Index("ix_people_user_importance", "user_id", "importance"),
+        Index("ix_people_user_person_id", "user_id", "person_id"),
+    )
 
     person_id: Mapped[str] = mapped_column(
         String, primary_key=True, default=lambda: generate(size=8)
@@ -79,7 +111,7 @@ class Person(Base):
         Enum("high", "medium", "low", name="importance_enum"), default="medium"
     )
     notes: Mapped[str] = mapped_column(String)
-    contact: Mapped[Dict[str, str]] = mapped_column(JSON)
+    contact: Mapped[Dict[str, str]] = mapped_column(JSONType)
 
     user: Mapped["User"] = relationship("User", back_populates="people")
 
@@ -89,6 +121,10 @@ class Person(Base):
 
 class Topic(Base):
     __tablename__ = "topics"
+    __table_args__ = (
+        gin_index("ix_topics_keywords_gin", "keywords"),
+        Index("ix_topics_user_topic_id", "user_id", "topic_id"),
+    )
 
     topic_id: Mapped[str] = mapped_column(
         String, primary_key=True, default=lambda: generate(size=8)
@@ -96,9 +132,9 @@ class Topic(Base):
     user_id: Mapped[str] = mapped_column(String, ForeignKey("users.id"))
     name: Mapped[str] = mapped_column(String, nullable=False)
     description: Mapped[str] = mapped_column(String)
-    keywords: Mapped[List[str]] = mapped_column(JSON)
-    related_people: Mapped[List[str]] = mapped_column(JSON)
-    related_tasks: Mapped[List[str]] = mapped_column(JSON)
+    keywords: Mapped[List[str]] = mapped_column(JSONType)
+    related_people: Mapped[List[str]] = mapped_column(JSONType)
+    related_tasks: Mapped[List[str]] = mapped_column(JSONType)
 
     user: Mapped["User"] = relationship("User", back_populates="topics")
 
@@ -108,6 +144,10 @@ class Topic(Base):
 
 class Note(Base):
     __tablename__ = "notes"
+    __table_args__ = (
+        Index("ix_notes_user_created", "user_id", "created_at"),
+        Index("ix_notes_user_note_id", "user_id", "note_id"),
+    )
 
     note_id: Mapped[str] = mapped_column(
         String, primary_key=True, default=lambda: generate(size=8)
@@ -116,9 +156,9 @@ class Note(Base):
     content: Mapped[str] = mapped_column(String)
     created_at: Mapped[str] = mapped_column(String)
     updated_at: Mapped[str] = mapped_column(String)
-    related_people: Mapped[List[str]] = mapped_column(JSON)
-    related_tasks: Mapped[List[str]] = mapped_column(JSON)
-    related_topics: Mapped[List[str]] = mapped_column(JSON)
+    related_people: Mapped[List[str]] = mapped_column(JSONType)
+    related_tasks: Mapped[List[str]] = mapped_column(JSONType)
+    related_topics: Mapped[List[str]] = mapped_column(JSONType)
 
     user: Mapped["User"] = relationship("User", back_populates="notes")
 
@@ -126,12 +166,55 @@ class Note(Base):
         super().__init__(**kwargs)
 
 
+def link_table(
+    name: str, source: str, source_key: str, target: str, *extra: Column
+) -> Table:
+    """
+    Junction table mirroring a JSON relationship field (kept in sync by
+    app/db/relationships.py); the reverse index makes "sources linked to target"
+    an index seek.
+    """
+    return Table(
+        name,
+        Base.metadata,
+        Column(
+            source, String, ForeignKey(source_key, ondelete="CASCADE"), primary_key=True
+        ),
+        Column(target, String, primary_key=True),
+        *extra,
+        Column("user_id", String, nullable=False),
+        Index(f"ix_{name}_reverse", "user_id", target, source),
+    )
+
+
+note_people = link_table("note_people", "note_id", "notes.note_id", "person_id")
+note_tasks = link_table("note_tasks", "note_id", "notes.note_id", "task_id")
+note_topics = link_table("note_topics", "note_id", "notes.note_id", "topic_id")
+topic_people = link_table("topic_people", "topic_id", "topics.topic_id", "person_id")
+topic_tasks = link_table("topic_tasks", "topic_id", "topics.topic_id", "task_id")
+# role: owner, final_beneficiary or stakeholder
+task_people = link_table(
+    "task_people",
+    "task_id",
+    "tasks.task_id",
+    "person_id",
+    Column("role", String, primary_key=True),
+)
+
+
 class SidekickThread(Base):
     __tablename__ = "sidekick_threads"
+    __table_args__ = (Index("ix_sidekick_threads_user_id", "user_id"),)
 
     id: Mapped[str] = mapped_column(String, primary_key=True, index=True)
     user_id: Mapped[str] = mapped_column(String, ForeignKey("users.id"))
-    conversation_history: Mapped[List[Dict[str, str]]] = mapped_column(JSON)
+    # Legacy history blob; messages now live in sidekick_messages and this stays
+    # empty once migrate_thread_history has moved a thread's history over
+    conversation_history: Mapped[List[Dict[str, str]]] = mapped_column(JSONType)
+    # Rolling summary of the messages before summary_seq, which have left the
+    # history window (see app/services/history_compactor.py)
+    history_summary: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    summary_seq: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
 
     user: Mapped["User"] = relationship("User", back_populates="sidekick_threads")
 
@@ -141,3 +224,62 @@ class SidekickThread(Base):
         self.id = id
         self.user_id = user_id
         self.conversation_history = conversation_history
+        self.history_summary = None
+        self.summary_seq = 0
+
+
+class SidekickMessage(Base):
+    """One message of a thread's history; appended, never rewritten"""
+
+    __tablename__ = "sidekick_messages"
+    __table_args__ = (
+        Index("ix_sidekick_messages_thread_seq", "thread_id", "seq", unique=True),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    thread_id: Mapped[str] = mapped_column(String, ForeignKey("sidekick_threads.id"))
+    seq: Mapped[int] = mapped_column(Integer)
+    role: Mapped[str] = mapped_column(String)
+    content: Mapped[str] = mapped_column(Text)
+    token_count: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    created_at: Mapped[str] = mapped_column(String)
+
+
+class SidekickJob(Base):
+    __tablename__ = "sidekick_jobs"
+
+    id: Mapped[str] = mapped_column(
+        String, primary_key=True, default=lambda: str(uuid.uuid4()), index=True
+    )
+    user_id: Mapped[str] = mapped_column(String, ForeignKey("users.id"), index=True)
+    # pending -> running -> completed | failed
+    status: Mapped[str] = mapped_column(String, default="pending", index=True)
+    request: Mapped[Dict[str, Any]] = mapped_column(JSONType)
+    result: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSONType, nullable=True)
+    error: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    created_at: Mapped[str] = mapped_column(String)
+    updated_at: Mapped[str] = mapped_column(String)
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+
+
+class BackgroundTask(Base):
+    __tablename__ = "background_tasks"
+
+    id: Mapped[str] = mapped_column(
+        String, primary_key=True, default=lambda: str(uuid.uuid4()), index=True
+    )
+    kind: Mapped[str] = mapped_column(String)
+    # Tasks sharing a group (e.g. "thread:<id>") are drained before that data is read
+    group_key: Mapped[Optional[str]] = mapped_column(String, nullable=True, index=True)
+    payload: Mapped[Dict[str, Any]] = mapped_column(JSONType)
+    # pending -> running -> deleted on success; failed once attempts run out
+    status: Mapped[str] = mapped_column(String, default="pending", index=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    error: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    created_at: Mapped[str] = mapped_column(String)
+    updated_at: Mapped[str] = mapped_column(String)
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
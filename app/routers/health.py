@@ -1,7 +1,8 @@
 from fastapi import APIRouter, HTTPException, Depends, Request
 import logging
 from app.core.config import settings
-from app.schemas.health_schema import HealthResponse
+from app.schemas.health_schema import HealthResponse, LLMCacheStatsResponse
+from app.services.response_cache import get_response_cache_stats
 from sqlalchemy.ext.asyncio import AsyncSession
 from utils.database import get_db
 from sqlalchemy import text
@@ -43,3 +44,12 @@ async def health_check(
 
     logger.info(f"Health check passed: {response.model_dump()}")
     return response
+
+
+@router.get("/health/llm-cache", response_model=LLMCacheStatsResponse)
+@limiter.limit(settings.rate_limits["default"])
+async def llm_cache_stats(request: Request) -> LLMCacheStatsResponse:
+    """
+    Hit/miss counters for the Sidekick LLM response cache.
+    """
+    return LLMCacheStatsResponse(**await get_response_cache_stats())
@@ -1,11 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, Query
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Query
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.operations import (
     get_sidekick_thread,
-    get_topics_for_user,
-    get_tasks_for_user,
-    get_people_for_user,
-    get_notes_for_user,
+    get_sidekick_thread_summaries,
+    get_sidekick_messages_page,
+    create_sidekick_job,
+    get_sidekick_job,
+    ENTITY_MODELS,
+    get_entities_page,
+    search_entities,
+    count_entities_for_user,
     create_topic,
     create_task,
     create_person,
@@ -22,6 +27,14 @@ from app.db.operations import (
 from app.schemas.sidekick_schema import (
     SidekickInput,
     SidekickOutput,
+    SidekickJobAccepted,
+    SidekickJobResponse,
+    TurnTimingStats,
+    SidekickThreadSummary,
+    SidekickMessageResponse,
+    SidekickMessagePage,
+    SearchResults,
+    ImportResult,
     TopicCreate,
     TaskCreate,
     PersonCreate,
@@ -34,36 +47,78 @@ from app.schemas.sidekick_schema import (
 )
 
 from app.services.sidekick_service import SidekickService
-from app.dependencies import get_current_user
-from utils.database import get_db
+from app.dependencies import get_current_user, get_job_queue, get_llm_client
+from app.services.sidekick_jobs import SidekickJobQueue
+from app.services.background_tasks import drain_thread_tasks
+from app.services.entity_transfer import export_entities, import_entities
+from app.services.history_compactor import assistant_followup
+from app.services.turn_timing import TurnTimer, get_turn_timing_stats, turn_timing
+from app.services.llm_client import LLMClient
+from utils.database import get_db, get_session
 from app.schemas.user_schema import UserInfo
 from app.core.rate_limit import limiter
 from app.core.config import settings
+import base64
+import json
 import logging
-from typing import cast
+from typing import (
+    Any,
+    AsyncIterator,
+    List,
+    Literal,
+    Optional,
+    Type,
+    TypeVar,
+    Union,
+    cast,
+)
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
-@router.post("/ask", response_model=SidekickOutput, tags=["sidekick"])
+@router.post(
+    "/ask",
+    response_model=SidekickOutput,
+    responses={202: {"model": SidekickJobAccepted}},
+    tags=["sidekick"],
+)
 @limiter.limit(settings.rate_limits["default"])
 async def process_sidekick_input(
     request: Request,
+    response: Response,
     sidekick_input: SidekickInput,
     current_user: UserInfo = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
-) -> SidekickOutput:
+    llm_client: LLMClient = Depends(get_llm_client),
+    job_queue: SidekickJobQueue = Depends(get_job_queue),
+) -> Union[SidekickOutput, JSONResponse]:
     try:
         if sidekick_input.thread_id:
+            await drain_thread_tasks(sidekick_input.thread_id)
             thread = await get_sidekick_thread(db, sidekick_input.thread_id)
             if not thread or thread.user_id != current_user.id:
                 raise HTTPException(status_code=404, detail="Thread not found")
 
-        sidekick_service = SidekickService()
-        result = await sidekick_service.process_input(
-            db, current_user.id, sidekick_input
-        )
+        if sidekick_input.mode == "async":
+            job = await create_sidekick_job(
+                db, current_user.id, sidekick_input.model_dump(exclude={"mode"})
+            )
+            await job_queue.submit(job.id)
+            logger.info(f"Queued sidekick job {job.id} for user {current_user.id}")
+            return JSONResponse(
+                status_code=202,
+                content=SidekickJobAccepted(
+                    job_id=job.id, status=job.status
+                ).model_dump(),
+            )
+
+        sidekick_service = SidekickService(llm_client)
+        with turn_timing(TurnTimer()) as timer:
+            result = await sidekick_service.process_input(
+                current_user.id, sidekick_input
+            )
+        response.headers["Server-Timing"] = timer.server_timing()
         logger.info(f"Processed sidekick input for user {current_user.id}")
         logger.info(f"API RESPONSE: {result}")
         return result
@@ -76,21 +131,291 @@ async def process_sidekick_input(
         raise HTTPException(status_code=500, detail="An unexpected error occurred")
 
 
+@router.get("/jobs/{job_id}", response_model=SidekickJobResponse, tags=["sidekick"])
+@limiter.limit(settings.rate_limits["default"])
+async def get_sidekick_job_status(
+    request: Request,
+    job_id: str,
+    current_user: UserInfo = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> SidekickJobResponse:
+    """Poll an async-mode /ask job; the result is also pushed over the WebSocket."""
+    job = await get_sidekick_job(db, job_id)
+    if not job or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return SidekickJobResponse(
+        job_id=job.id,
+        status=cast(Any, job.status),
+        result=SidekickOutput.model_validate(job.result) if job.result else None,
+        error=job.error,
+        created_at=job.created_at,
+        updated_at=job.updated_at,
+    )
+
+
+@router.get("/timings", response_model=TurnTimingStats, tags=["sidekick"])
+async def get_sidekick_timings(
+    thread_id: Optional[str] = None,
+    current_user: UserInfo = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> TurnTimingStats:
+    """p50/p95 per turn stage for the current user, or for one of their threads."""
+    if thread_id is None:
+        stats = await get_turn_timing_stats("user", current_user.id)
+    else:
+        await drain_thread_tasks(thread_id)
+        thread = await get_sidekick_thread(db, thread_id)
+        if not thread or thread.user_id != current_user.id:
+            raise HTTPException(status_code=404, detail="Thread not found")
+        stats = await get_turn_timing_stats("thread", thread_id)
+    return TurnTimingStats.model_validate(stats)
+
+
+@router.get(
+    "/threads",
+    response_model=PaginatedResponse[SidekickThreadSummary],
+    tags=["sidekick"],
+)
+async def list_sidekick_threads(
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+    current_user: UserInfo = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> PaginatedResponse[SidekickThreadSummary]:
+    """The user's threads, most recently active first, without their history."""
+    summaries, total = await get_sidekick_thread_summaries(
+        db, current_user.id, (page - 1) * page_size, page_size
+    )
+    return PaginatedResponse[SidekickThreadSummary](
+        items=[
+            SidekickThreadSummary(
+                thread_id=thread_id,
+                message_count=message_count,
+                last_message_at=last_message_at,
+            )
+            for thread_id, message_count, last_message_at in summaries
+        ],
+        total=total,
+        page=page,
+        page_size=page_size,
+        has_more=page * page_size < total,
+    )
+
+
+@router.get(
+    "/threads/{thread_id}/messages",
+    response_model=SidekickMessagePage,
+    tags=["sidekick"],
+)
+async def list_sidekick_messages(
+    thread_id: str,
+    before: Optional[int] = Query(None, ge=0),
+    after: Optional[int] = Query(None, ge=-1),
+    limit: int = Query(50, ge=1, le=200),
+    include_payloads: bool = True,
+    current_user: UserInfo = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> SidekickMessagePage:
+    """
+    Page through a thread's messages by seq. Without a cursor the latest `limit`
+    messages are returned; before/after page to older/newer ones. With
+    include_payloads=false assistant messages carry only their followup text.
+    """
+    if before is not None and after is not None:
+        raise HTTPException(status_code=400, detail="Use either before or after")
+    await drain_thread_tasks(thread_id)
+    thread = await get_sidekick_thread(db, thread_id)
+    if not thread or thread.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Thread not found")
+
+    messages, has_more = await get_sidekick_messages_page(
+        db, thread_id, limit, before=before, after=after
+    )
+    items = [SidekickMessageResponse.model_validate(m) for m in messages]
+    if not include_payloads:
+        for item in items:
+            if item.role == "assistant":
+                item.content = assistant_followup(item.content)
+    return SidekickMessagePage(
+        items=items,
+        has_more=has_more,
+        before_cursor=items[0].seq if items else None,
+        after_cursor=items[-1].seq if items else None,
+    )
+
+
+def _format_sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@router.post("/ask/stream", tags=["sidekick"])
+@limiter.limit(settings.rate_limits["default"])
+async def stream_sidekick_input(
+    request: Request,
+    sidekick_input: SidekickInput,
+    current_user: UserInfo = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    llm_client: LLMClient = Depends(get_llm_client),
+) -> StreamingResponse:
+    """
+    Server-Sent Events variant of /ask.
+
+    Emits "followup" events with text deltas, "entity" events as each entity
+    is parsed, then a "done" event with the SidekickOutput (or "error").
+    """
+    if sidekick_input.thread_id:
+        await drain_thread_tasks(sidekick_input.thread_id)
+        thread = await get_sidekick_thread(db, sidekick_input.thread_id)
+        if not thread or thread.user_id != current_user.id:
+            raise HTTPException(status_code=404, detail="Thread not found")
+
+    sidekick_service = SidekickService(llm_client)
+
+    async def event_stream() -> AsyncIterator[str]:
+        # The request-scoped session is closed before the body is streamed
+        async with get_session() as session:
+            async for event in sidekick_service.process_input_stream(
+                session, current_user.id, sidekick_input
+            ):
+                yield _format_sse(event["event"], event["data"])
+        logger.info(f"Streamed sidekick input for user {current_user.id}")
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/search", response_model=SearchResults, tags=["sidekick"])
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    types: List[Literal["notes", "tasks", "topics", "people"]] = Query(
+        ["notes", "tasks", "topics", "people"]
+    ),
+    limit: int = Query(10, ge=1, le=50),
+    current_user: UserInfo = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> SearchResults:
+    """Full-text search over the user's entities, ranked per type"""
+    results = {
+        entity_type: await search_entities(db, entity_type, current_user.id, q, limit)
+        for entity_type in dict.fromkeys(types)
+    }
+    return SearchResults.model_validate(results, from_attributes=True)
+
+
+@router.get("/export", tags=["sidekick"])
+@limiter.limit(settings.rate_limits["default"])
+async def export_user_entities(
+    request: Request,
+    current_user: UserInfo = Depends(get_current_user),
+) -> StreamingResponse:
+    """All of the user's people, tasks, topics and notes as streamed NDJSON"""
+
+    async def ndjson_stream() -> AsyncIterator[str]:
+        # The request-scoped session is closed before the body is streamed
+        async with get_session() as session:
+            async for lines in export_entities(session, current_user.id):
+                yield lines
+        logger.info(f"Exported entities for user {current_user.id}")
+
+    return StreamingResponse(
+        ndjson_stream(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="foxhole-export.ndjson"'},
+    )
+
+
+@router.post("/import", response_model=ImportResult, tags=["sidekick"])
+@limiter.limit(settings.rate_limits["default"])
+async def import_user_entities(
+    request: Request,
+    current_user: UserInfo = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+) -> ImportResult:
+    """
+    Upsert entities from an NDJSON body in the /export format. The body is read
+    incrementally and committed in batches, so an interrupted import keeps the
+    batches already written and can simply be retried.
+    """
+    return await import_entities(db, current_user.id, request.stream())
+
+
+def _encode_cursor(entity_id: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"after": entity_id}).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> str:
+    try:
+        after = json.loads(base64.urlsafe_b64decode(cursor.encode()))["after"]
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(after, str):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return after
+
+
+EntitySchema = TypeVar(
+    "EntitySchema", TopicSchema, TaskSchema, PersonSchema, NoteSchema
+)
+
+
+async def _list_entities(
+    db: AsyncSession,
+    entity_type: str,
+    schema: Type[EntitySchema],
+    user_id: str,
+    page: int,
+    page_size: int,
+    cursor: Optional[str],
+    include_total: bool,
+) -> PaginatedResponse[EntitySchema]:
+    """
+    A page of entities in id order, fetched with LIMIT: after the opaque cursor
+    when one is given (keyset), otherwise at page (offset). The total is a
+    separately cached COUNT and is skipped when include_total is false.
+    """
+    _, id_field = ENTITY_MODELS[entity_type]
+    after = _decode_cursor(cursor) if cursor else None
+    entities, has_more = await get_entities_page(
+        db, entity_type, user_id, page_size, (page - 1) * page_size, after
+    )
+    total = (
+        await count_entities_for_user(db, entity_type, user_id)
+        if include_total
+        else None
+    )
+    return PaginatedResponse(
+        items=[schema.model_validate(entity) for entity in entities],
+        total=total,
+        page=page,
+        page_size=page_size,
+        has_more=has_more,
+        next_cursor=(
+            _encode_cursor(getattr(entities[-1], id_field)) if has_more else None
+        ),
+    )
+
+
 @router.get("/topics", response_model=PaginatedResponse[TopicSchema], tags=["topics"])
 async def list_topics(
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     current_user: UserInfo = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ) -> PaginatedResponse[TopicSchema]:
-    topics = await get_topics_for_user(db, current_user.id)
-    start = (page - 1) * page_size
-    end = start + page_size
-    return PaginatedResponse[TopicSchema](
-        items=[TopicSchema.model_validate(topic) for topic in topics[start:end]],
-        total=len(topics),
-        page=page,
-        page_size=page_size,
+    return await _list_entities(
+        db,
+        "topics",
+        TopicSchema,
+        current_user.id,
+        page,
+        page_size,
+        cursor,
+        include_total,
     )
 
 
@@ -133,17 +458,13 @@ async def delete_existing_topic(
 async def list_tasks(
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     current_user: UserInfo = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ) -> PaginatedResponse[TaskSchema]:
-    tasks = await get_tasks_for_user(db, current_user.id)
-    start = (page - 1) * page_size
-    end = start + page_size
-    return PaginatedResponse[TaskSchema](
-        items=[TaskSchema.model_validate(task) for task in tasks[start:end]],
-        total=len(tasks),
-        page=page,
-        page_size=page_size,
+    return await _list_entities(
+        db, "tasks", TaskSchema, current_user.id, page, page_size, cursor, include_total
     )
 
 
@@ -186,17 +507,20 @@ async def delete_existing_task(
 async def list_people(
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     current_user: UserInfo = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ) -> PaginatedResponse[PersonSchema]:
-    people = await get_people_for_user(db, current_user.id)
-    start = (page - 1) * page_size
-    end = start + page_size
-    return PaginatedResponse[PersonSchema](
-        items=[PersonSchema.model_validate(person) for person in people[start:end]],
-        total=len(people),
-        page=page,
-        page_size=page_size,
+    return await _list_entities(
+        db,
+        "people",
+        PersonSchema,
+        current_user.id,
+        page,
+        page_size,
+        cursor,
+        include_total,
     )
 
 
@@ -239,17 +563,13 @@ async def delete_existing_person(
 async def list_notes(
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    include_total: bool = True,
     current_user: UserInfo = Depends(get_current_user),
     db: AsyncSession = Depends(get_db),
 ) -> PaginatedResponse[NoteSchema]:
-    notes = await get_notes_for_user(db, current_user.id)
-    start = (page - 1) * page_size
-    end = start + page_size
-    return PaginatedResponse[NoteSchema](
-        items=[NoteSchema.model_validate(note) for note in notes[start:end]],
-        total=len(notes),
-        page=page,
-        page_size=page_size,
+    return await _list_entities(
+        db, "notes", NoteSchema, current_user.id, page, page_size, cursor, include_total
     )
 
 
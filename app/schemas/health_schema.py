@@ -5,3 +5,11 @@ class HealthResponse(BaseModel):
     status: str
     version: str
     database_status: str
+
+
+class LLMCacheStatsResponse(BaseModel):
+    enabled: bool
+    hits: int
+    misses: int
+    entries: int
+    hit_rate: float
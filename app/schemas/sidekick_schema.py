@@ -128,9 +128,35 @@ class SidekickThreadResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class SidekickThreadSummary(BaseModel):
+    thread_id: str
+    message_count: int
+    last_message_at: Optional[str] = None
+
+
+class SidekickMessageResponse(BaseModel):
+    seq: int
+    role: str
+    content: str
+    token_count: Optional[int] = None
+    created_at: str
+    model_config = ConfigDict(from_attributes=True)
+
+
+class SidekickMessagePage(BaseModel):
+    items: List[SidekickMessageResponse]
+    has_more: bool
+    # Pass as before= for older messages, or after= for newer ones
+    before_cursor: Optional[int] = None
+    after_cursor: Optional[int] = None
+
+
 class SidekickInput(BaseModel):
     user_input: str
     thread_id: Optional[str] = None
+    engine: Optional[Literal["legacy", "v2"]] = None  # Defaults to SIDEKICK_ENGINE
+    # "async" returns 202 with a job id; the result is pushed over the WebSocket
+    mode: Literal["sync", "async"] = "sync"
 
 
 class TokenUsage(BaseModel):
@@ -150,11 +176,55 @@ class SidekickOutput(BaseModel):
     token_usage: TokenUsage
 
 
+class SidekickJobAccepted(BaseModel):
+    job_id: str
+    status: str
+
+
+class SidekickJobResponse(BaseModel):
+    job_id: str
+    status: Literal["pending", "running", "completed", "failed"]
+    result: Optional[SidekickOutput] = None
+    error: Optional[str] = None
+    created_at: str
+    updated_at: str
+
+
+class TimingPercentiles(BaseModel):
+    count: int
+    p50: float
+    p95: float
+
+
+class TurnTimingStats(BaseModel):
+    scope: Literal["user", "thread"]
+    samples: int
+    # Stage name (plus "total" and "prompt_tokens") -> percentiles; times in ms
+    metrics: Dict[str, TimingPercentiles]
+
+
+class SearchResults(BaseModel):
+    # Best match first within each type; types that were not searched are empty
+    notes: List[Note] = Field(default_factory=list)
+    tasks: List[Task] = Field(default_factory=list)
+    topics: List[Topic] = Field(default_factory=list)
+    people: List[Person] = Field(default_factory=list)
+
+
+class ImportResult(BaseModel):
+    imported: Dict[str, int]  # entities written, per type
+    rejected: int = 0  # lines skipped as invalid
+    errors: List[str] = Field(default_factory=list)  # the first few, with line numbers
+
+
 T = TypeVar("T")
 
 
 class PaginatedResponse(BaseModel, Generic[T]):
     items: List[T]
-    total: int
+    total: Optional[int]  # None when the list endpoint is asked to skip the count
     page: int
     page_size: int
+    has_more: bool = False
+    # Opaque keyset cursor for the page after this one, on the entity lists
+    next_cursor: Optional[str] = None
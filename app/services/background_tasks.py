@@ -0,0 +1,265 @@
+"""
+Durable in-process queue for work that can finish after the response is sent.
+
+A task is a row in background_tasks (kind, payload, optional group key) that a
+pool of workers runs through the handler registered for its kind. enqueue()
+commits the row before it returns, in the caller's session when one is given,
+so a task the response depends on outlives a crash. Rows survive restarts and
+are re-queued at startup, a task whose worker stopped is reclaimed after
+SIDEKICK_TASK_STALE_SECONDS, and failures are retried with exponential backoff
+up to SIDEKICK_TASK_MAX_ATTEMPTS. A task's row is deleted in the same
+transaction as its handler's writes, so a handler whose effects are all in that
+transaction is applied exactly once; any other effects must be idempotent.
+
+Tasks sharing a group key run one at a time, in the order they were queued,
+across all processes: a task is only claimed once its group's earlier tasks are
+done, and finishing a task submits the next one. Readers that need a task's
+effects call drain(group_key) first, which runs the group's outstanding tasks
+inline (or waits for the worker running them), so deferred writes are never
+observed half-done.
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta, UTC
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.operations import (
+    claim_background_task,
+    create_background_task,
+    delete_background_task,
+    get_background_task,
+    get_unfinished_background_tasks,
+    release_background_task,
+)
+from utils.database import get_session
+
+logger = logging.getLogger(__name__)
+
+TaskHandler = Callable[[AsyncSession, Dict[str, Any]], Awaitable[None]]
+
+TASK_HANDLERS: Dict[str, TaskHandler] = {}
+
+
+def register_task_handler(kind: str, handler: TaskHandler) -> None:
+    TASK_HANDLERS[kind] = handler
+
+
+class BackgroundTaskQueue:
+    """Queue of task ids drained by a fixed number of worker tasks"""
+
+    def __init__(
+        self,
+        workers: int = settings.SIDEKICK_TASK_WORKERS,
+        max_attempts: int = settings.SIDEKICK_TASK_MAX_ATTEMPTS,
+        retry_backoff: float = settings.SIDEKICK_TASK_RETRY_BACKOFF,
+    ) -> None:
+        self.worker_count = max(workers, 1)
+        self.max_attempts = max(max_attempts, 1)
+        self.retry_backoff = retry_backoff
+        self._queue: Optional["asyncio.Queue[str]"] = None
+        self._workers: List["asyncio.Task[None]"] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Tasks running in this process, so drain() can wait for them
+        self._running: Dict[str, asyncio.Event] = {}
+        self._retries: List["asyncio.Task[None]"] = []
+
+    def _ensure_started(self) -> "asyncio.Queue[str]":
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._running = {}
+            self._workers = [
+                asyncio.create_task(self._worker(self._queue))
+                for _ in range(self.worker_count)
+            ]
+        return self._queue
+
+    async def start(self) -> None:
+        """Start the workers and re-queue tasks a previous process left unfinished"""
+        self._ensure_started()
+        async with get_session() as db:
+            unfinished = await get_unfinished_background_tasks(db)
+        for task in unfinished:
+            await self.submit(task.id)
+        if unfinished:
+            logger.info(f"Re-queued {len(unfinished)} unfinished background tasks")
+
+    async def stop(self) -> None:
+        """Cancel the workers; queued tasks stay pending in the database"""
+        for worker in self._workers + self._retries:
+            worker.cancel()
+        await asyncio.gather(*self._workers, *self._retries, return_exceptions=True)
+        self._workers = []
+        self._retries = []
+        self._queue = None
+
+    async def enqueue(
+        self,
+        kind: str,
+        payload: Dict[str, Any],
+        group_key: Optional[str] = None,
+        db: Optional[AsyncSession] = None,
+    ) -> str:
+        """
+        Commit a task and hand it to the workers. With db the row is inserted
+        and committed in the caller's session instead of a new one.
+        """
+        if db is not None:
+            task = await create_background_task(db, kind, payload, group_key)
+        else:
+            async with get_session() as session:
+                task = await create_background_task(session, kind, payload, group_key)
+        await self.submit(task.id)
+        return task.id
+
+    async def submit(self, task_id: str) -> None:
+        await self._ensure_started().put(task_id)
+
+    async def join(self) -> None:
+        """Wait until every submitted task has been processed"""
+        await self._ensure_started().join()
+
+    async def _worker(self, queue: "asyncio.Queue[str]") -> None:
+        while True:
+            task_id = await queue.get()
+            try:
+                await self.run_task(task_id)
+            except Exception as e:
+                logger.error(f"Background task {task_id} crashed: {str(e)}")
+            finally:
+                queue.task_done()
+
+    async def run_task(self, task_id: str) -> bool:
+        """Claim and run one task; False when it is finished or owned elsewhere"""
+        stale_before = (
+            datetime.now(UTC) - timedelta(seconds=settings.SIDEKICK_TASK_STALE_SECONDS)
+        ).isoformat()
+        done = asyncio.Event()
+        async with get_session() as db:
+            if not await claim_background_task(db, task_id, stale_before):
+                return False
+            self._running[task_id] = done
+            try:
+                task = await get_background_task(db, task_id)
+                if task is None:
+                    return False
+                kind, payload, attempts = task.kind, task.payload, task.attempts
+                group_key = task.group_key
+                handler = TASK_HANDLERS.get(kind)
+                try:
+                    if handler is None:
+                        raise LookupError(f"No handler for task kind {kind}")
+                    # Committed by the handler, together with its writes
+                    await delete_background_task(db, task_id, commit=False)
+                    await handler(db, payload)
+                    await db.commit()
+                except Exception as e:
+                    await db.rollback()
+                    await self._handle_failure(db, task_id, attempts, str(e))
+                if group_key is not None:
+                    await self._submit_next(db, group_key, task_id)
+                return True
+            finally:
+                del self._running[task_id]
+                done.set()
+
+    async def _handle_failure(
+        self, db: AsyncSession, task_id: str, attempts: int, error: str
+    ) -> None:
+        if attempts >= self.max_attempts:
+            logger.error(f"Background task {task_id} failed for good: {error}")
+            await release_background_task(db, task_id, "failed", error)
+            return
+        delay = self.retry_backoff * 2 ** (attempts - 1)
+        logger.warning(
+            f"Background task {task_id} failed (attempt {attempts}), "
+            f"retrying in {delay:.1f}s: {error}"
+        )
+        await release_background_task(db, task_id, "pending", error)
+        self._retries = [retry for retry in self._retries if not retry.done()]
+        self._retries.append(asyncio.create_task(self._retry_later(task_id, delay)))
+
+    async def _submit_next(
+        self, db: AsyncSession, group_key: str, task_id: str
+    ) -> None:
+        """Hand the group's next queued task to the workers once task_id is done"""
+        outstanding = await get_unfinished_background_tasks(db, group_key)
+        pending = [task for task in outstanding if task.status == "pending"]
+        # A task_id awaiting its retry still goes first
+        if pending and pending[0].id != task_id:
+            await self.submit(pending[0].id)
+
+    async def _retry_later(self, task_id: str, delay: float) -> None:
+        await asyncio.sleep(delay)
+        await self.submit(task_id)
+
+    async def drain(
+        self, group_key: str, timeout: float = settings.SIDEKICK_TASK_DRAIN_TIMEOUT
+    ) -> None:
+        """Finish the group's outstanding tasks before its data is read"""
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                async with get_session() as db:
+                    outstanding = await get_unfinished_background_tasks(db, group_key)
+                if not outstanding:
+                    return
+                for task in outstanding:
+                    running = self._running.get(task.id)
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError()
+                    if running is not None:
+                        await asyncio.wait_for(running.wait(), remaining)
+                    elif not await self.run_task(task.id):
+                        # Claimed by another process; poll until it finishes
+                        await asyncio.sleep(0.05)
+        except asyncio.TimeoutError:
+            logger.warning(f"Timed out draining background tasks for {group_key}")
+
+
+_task_queue: Optional[BackgroundTaskQueue] = None
+
+
+async def init_background_tasks() -> BackgroundTaskQueue:
+    """
+    Creates the shared task queue on application startup and resumes its tasks.
+    """
+    queue = get_background_task_queue()
+    await queue.start()
+    return queue
+
+
+async def close_background_tasks() -> None:
+    """
+    Stops the shared task queue workers on application shutdown.
+    """
+    global _task_queue
+    if _task_queue:
+        await _task_queue.stop()
+        _task_queue = None
+
+
+def get_background_task_queue() -> BackgroundTaskQueue:
+    """
+    Returns the shared task queue, creating it lazily when startup hooks have not run.
+    """
+    global _task_queue
+    if _task_queue is None:
+        _task_queue = BackgroundTaskQueue()
+    return _task_queue
+
+
+def thread_group(thread_id: str) -> str:
+    """Group key for deferred writes that must land before a thread is read"""
+    return f"thread:{thread_id}"
+
+
+async def drain_thread_tasks(thread_id: str) -> None:
+    """Apply a thread's deferred writes; a no-op unless SIDEKICK_DEFER_WRITES"""
+    if settings.SIDEKICK_DEFER_WRITES:
+        await get_background_task_queue().drain(thread_group(thread_id))
@@ -0,0 +1,197 @@
+"""
+Relevance-ranked context selection for Sidekick prompts.
+
+Instead of sending every entity a user owns, the legacy engine ranks the user's
+people, tasks, topics and notes with BM25 against the latest user message and
+recent history, then keeps the top entities that fit a token budget. Indexes
+are kept in memory under the user's context snapshot key, so the corpus is
+tokenized once per entity version rather than on every turn.
+"""
+
+import json
+import math
+import re
+from collections import Counter, OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+from app.core.config import settings
+from app.services.prompt_budget import count_text_tokens
+
+ENTITY_TYPES = ("people", "tasks", "topics", "notes")
+
+# Fields indexed for each entity type
+SEARCH_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "people": ("name", "designation", "relation_type", "notes"),
+    "tasks": ("description", "actions", "schedule"),
+    "topics": ("name", "description", "keywords"),
+    "notes": ("content",),
+}
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i in is it its me my of on or "
+    "our so that the their them this to was we what when where which who will with "
+    "you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens without stopwords"""
+    return [
+        token
+        for token in _TOKEN_RE.findall(text.lower())
+        if len(token) > 1 and token not in _STOPWORDS
+    ]
+
+
+def estimate_entity_tokens(entity: Dict[str, Any]) -> int:
+    """Prompt tokens for a serialized entity, plus its separator in the context"""
+    return count_text_tokens(json.dumps(entity, ensure_ascii=False, default=str)) + 1
+
+
+def _entity_text(entity_type: str, entity: Dict[str, Any]) -> str:
+    parts: List[str] = []
+    for field in SEARCH_FIELDS[entity_type]:
+        value = entity.get(field)
+        if isinstance(value, list):
+            parts.extend(str(item) for item in value)
+        elif value:
+            parts.append(str(value))
+    return " ".join(parts)
+
+
+class RelevanceIndex:
+    """BM25 index over one user's entities"""
+
+    def __init__(
+        self, context: Dict[str, List[Dict[str, Any]]], k1: float = 1.5, b: float = 0.75
+    ) -> None:
+        self.k1 = k1
+        self.b = b
+        self.documents: List[Tuple[str, Dict[str, Any]]] = []
+        self.token_costs: List[int] = []
+        self.term_freqs: List[Counter] = []
+        self.doc_freqs: Counter = Counter()
+
+        for entity_type in ENTITY_TYPES:
+            for entity in context.get(entity_type, []):
+                terms = Counter(tokenize(_entity_text(entity_type, entity)))
+                self.documents.append((entity_type, entity))
+                self.token_costs.append(estimate_entity_tokens(entity))
+                self.term_freqs.append(terms)
+                self.doc_freqs.update(terms.keys())
+
+        self.doc_lengths = [sum(terms.values()) for terms in self.term_freqs]
+        self.avg_length = (
+            sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0.0
+        )
+
+    def scores(self, query: str) -> List[float]:
+        """BM25 score of every document for the query"""
+        query_terms = Counter(tokenize(query))
+        total_docs = len(self.documents)
+        results = []
+        for terms, length in zip(self.term_freqs, self.doc_lengths):
+            score = 0.0
+            for term, query_count in query_terms.items():
+                freq = terms.get(term)
+                if not freq:
+                    continue
+                df = self.doc_freqs[term]
+                idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+                norm = self.k1 * (
+                    1 - self.b + self.b * length / (self.avg_length or 1.0)
+                )
+                score += query_count * idf * freq * (self.k1 + 1) / (freq + norm)
+            results.append(score)
+        return results
+
+    def select(
+        self, query: str, token_budget: int, top_k: int
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Return the top_k most relevant entities that fit in token_budget.
+
+        Ties (including entities with no overlap at all) are broken by entity type
+        and then by most recently stored first.
+        """
+        scores = self.scores(query)
+        type_rank = {entity_type: i for i, entity_type in enumerate(ENTITY_TYPES)}
+        order = sorted(
+            range(len(self.documents)),
+            key=lambda i: (-scores[i], type_rank[self.documents[i][0]], -i),
+        )
+
+        selected: Dict[str, List[Dict[str, Any]]] = {t: [] for t in ENTITY_TYPES}
+        used_tokens = 0
+        count = 0
+        for i in order:
+            if count >= top_k:
+                break
+            entity_type, entity = self.documents[i]
+            cost = self.token_costs[i]
+            if used_tokens + cost > token_budget:
+                continue
+            selected[entity_type].append(entity)
+            used_tokens += cost
+            count += 1
+        return selected
+
+
+# Snapshot key -> index, least recently used first
+_index_cache: "OrderedDict[str, RelevanceIndex]" = OrderedDict()
+
+
+def get_relevance_index(
+    context: Dict[str, List[Dict[str, Any]]], cache_key: Optional[str] = None
+) -> RelevanceIndex:
+    """
+    The index for context, reused while cache_key (the versioned context
+    snapshot key) is unchanged; without a key it is built every time.
+    """
+    if cache_key is None:
+        return RelevanceIndex(context)
+    index = _index_cache.get(cache_key)
+    if index is not None:
+        _index_cache.move_to_end(cache_key)
+        return index
+    index = RelevanceIndex(context)
+    _index_cache[cache_key] = index
+    while len(_index_cache) > settings.SIDEKICK_CONTEXT_INDEX_CACHE_SIZE:
+        _index_cache.popitem(last=False)
+    return index
+
+
+def build_relevance_query(
+    conversation_history: List[Dict[str, str]], history_messages: int
+) -> str:
+    """Query text from the latest user message (weighted double) and recent user turns"""
+    user_messages = [
+        str(msg.get("content", ""))
+        for msg in conversation_history
+        if msg.get("role") == "user"
+    ]
+    if not user_messages:
+        return ""
+    recent = user_messages[-history_messages:] if history_messages > 0 else []
+    return " ".join([user_messages[-1]] + recent)
+
+
+def select_relevant_context(
+    context: Dict[str, List[Dict[str, Any]]],
+    conversation_history: List[Dict[str, str]],
+    token_budget: int = settings.SIDEKICK_CONTEXT_TOKEN_BUDGET,
+    top_k: int = settings.SIDEKICK_CONTEXT_TOP_K,
+    history_messages: int = settings.SIDEKICK_CONTEXT_HISTORY_MESSAGES,
+    cache_key: Optional[str] = None,
+) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Trim a full user context to the most relevant entities within the budget.
+    cache_key is the context's snapshot key (see get_relevance_index).
+    """
+    # The index holds the entity token costs, so they are counted once per version
+    index = get_relevance_index(context, cache_key)
+    if len(index.documents) <= top_k and sum(index.token_costs) <= token_budget:
+        return context
+
+    query = build_relevance_query(conversation_history, history_messages)
+    return index.select(query, token_budget, top_k)
@@ -0,0 +1,153 @@
+"""
+Streaming NDJSON export and import of a user's entities.
+
+Every line is {"type": "people" | "tasks" | "topics" | "notes", "entity": {...}},
+with the entity as the list endpoints return it. Export reads each table through
+a server-side cursor and import writes through upsert_entity_rows one batch
+per transaction, so memory use depends on the batch size, not the account size.
+"""
+
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List, Tuple
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.operations import (
+    ENTITY_MODELS,
+    stream_entity_rows,
+    upsert_entity_rows,
+)
+from app.schemas.sidekick_schema import (
+    ImportResult,
+    NoteCreate,
+    PersonCreate,
+    TaskCreate,
+    TopicCreate,
+    Note as NoteSchema,
+    Person as PersonSchema,
+    Task as TaskSchema,
+    Topic as TopicSchema,
+)
+
+logger = logging.getLogger(__name__)
+
+# Entity type -> (import schema, export schema), in export order so that people
+# come before the tasks, topics and notes that refer to them
+TRANSFER_SCHEMAS: Dict[str, Tuple[Any, Any]] = {
+    "people": (PersonCreate, PersonSchema),
+    "tasks": (TaskCreate, TaskSchema),
+    "topics": (TopicCreate, TopicSchema),
+    "notes": (NoteCreate, NoteSchema),
+}
+
+MAX_REPORTED_ERRORS = 100
+
+
+async def export_entities(
+    db: AsyncSession,
+    user_id: str,
+    batch_size: int = settings.SIDEKICK_EXPORT_BATCH_SIZE,
+) -> AsyncIterator[str]:
+    """NDJSON lines for all of user_id's entities, yielded batch_size lines at a time"""
+    lines: List[str] = []
+    for entity_type, (_, schema) in TRANSFER_SCHEMAS.items():
+        async for row in stream_entity_rows(db, entity_type, user_id, batch_size):
+            entity = schema.model_validate(row).model_dump(mode="json")
+            lines.append(json.dumps({"type": entity_type, "entity": entity}) + "\n")
+            if len(lines) >= batch_size:
+                yield "".join(lines)
+                lines = []
+    if lines:
+        yield "".join(lines)
+
+
+async def _split_lines(
+    chunks: AsyncIterator[bytes], max_line_bytes: int
+) -> AsyncIterator[bytes]:
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield line
+        if len(buffer) > max_line_bytes:
+            raise HTTPException(
+                status_code=413, detail=f"Line longer than {max_line_bytes} bytes"
+            )
+    if buffer:
+        yield buffer
+
+
+def _parse_line(line: bytes) -> Tuple[str, Dict[str, Any]]:
+    record = json.loads(line)
+    if not isinstance(record, dict):
+        raise ValueError("expected a JSON object")
+    entity_type = record.get("type")
+    if entity_type not in TRANSFER_SCHEMAS:
+        raise ValueError(f"unknown entity type {entity_type!r}")
+    create_schema, _ = TRANSFER_SCHEMAS[entity_type]
+    return entity_type, create_schema.model_validate(record.get("entity")).model_dump()
+
+
+async def import_entities(
+    db: AsyncSession,
+    user_id: str,
+    chunks: AsyncIterator[bytes],
+    batch_size: int = settings.SIDEKICK_IMPORT_BATCH_SIZE,
+    max_line_bytes: int = settings.SIDEKICK_IMPORT_MAX_LINE_BYTES,
+) -> ImportResult:
+    """
+    Upsert the entities of an NDJSON byte stream for user_id, committing every
+    batch_size entities. Invalid lines, and entities that could not be saved,
+    are skipped and reported; IDs owned by another user get new IDs, as with
+    Sidekick writes, and later lines that refer to those IDs are rewritten to
+    match. A line repeating an ID within a batch replaces the earlier one.
+    """
+    result = ImportResult(imported={entity_type: 0 for entity_type in TRANSFER_SCHEMAS})
+    rows_by_type: Dict[str, List[Dict[str, Any]]] = {}
+    renamed_ids: Dict[str, Dict[str, str]] = {}
+    pending = 0
+
+    def _report(error: str) -> None:
+        if len(result.errors) < MAX_REPORTED_ERRORS:
+            result.errors.append(error)
+
+    async def flush() -> None:
+        nonlocal rows_by_type, pending
+        saved = await upsert_entity_rows(db, user_id, rows_by_type, renamed_ids)
+        for entity_type, rows in rows_by_type.items():
+            id_field = ENTITY_MODELS[entity_type][1]
+            ids = [row[id_field] for row in rows if row.get(id_field)]
+            expected = len(rows) - len(ids) + len(set(ids))
+            stored = len(saved.get(entity_type, []))
+            result.imported[entity_type] += stored
+            if stored < expected:
+                result.rejected += expected - stored
+                _report(f"{expected - stored} {entity_type} could not be saved")
+        rows_by_type, pending = {}, 0
+
+    line_number = 0
+    async for line in _split_lines(chunks, max_line_bytes):
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            entity_type, row = _parse_line(line)
+        except (ValueError, ValidationError) as e:
+            result.rejected += 1
+            _report(f"Line {line_number}: {str(e)}")
+            continue
+        rows_by_type.setdefault(entity_type, []).append(row)
+        pending += 1
+        if pending >= batch_size:
+            await flush()
+    if pending:
+        await flush()
+
+    logger.info(
+        f"Imported {sum(result.imported.values())} entities for user {user_id}, "
+        f"rejected {result.rejected} lines"
+    )
+    return result
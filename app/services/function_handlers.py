@@ -3,9 +3,9 @@ Function handlers for OpenAI function calls.
 These handlers implement the actual database operations for each function.
 """
 
-from typing import Dict, Any, Type
+from typing import Dict, Any, List, Optional, Tuple, Type
 from abc import ABC, abstractmethod
-from sqlalchemy import select
+from sqlalchemy import Select, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.schemas.openai_functions import (
     PersonSearchParams,
@@ -20,14 +20,43 @@ from app.schemas.sidekick_schema import (
     Note as NoteSchema,
 )
 from app.models import Person, Task, Topic, Note
+from app.db.json_filters import json_array_contains
+from app.db.relationships import linked_source_ids
+from app.db.fulltext import (
+    apply_fulltext_match,
+    contains_pattern,
+    fulltext_query,
+    fulltext_ready,
+)
+
+
+async def text_search(
+    db: AsyncSession, query: Select[Any], entity_type: str, column: Any, search: str
+) -> Select[Any]:
+    """bm25-ranked full-text match when the FTS index exists, else a substring scan"""
+    match = fulltext_query(search)
+    if match and await fulltext_ready(db):
+        return apply_fulltext_match(query, entity_type, match)
+    return query.where(column.ilike(contains_pattern(search), escape="\\"))
 
 
 class FunctionHandler(ABC):
-    """Base class for function handlers"""
+    """Base class for function handlers; limit caps the rows each call reads"""
 
-    def __init__(self, db: AsyncSession, user_id: str):
+    def __init__(self, db: AsyncSession, user_id: str, limit: Optional[int] = None):
         self.db = db
         self.user_id = user_id
+        self.limit = limit
+
+    async def _fetch(self, query: Select[Any]) -> Tuple[List[Any], bool]:
+        """The query's rows up to the limit, and whether more matched"""
+        if self.limit is None:
+            result = await self.db.execute(query)
+            return list(result.scalars().all()), False
+        # One extra row tells whether the results were cut off
+        result = await self.db.execute(query.limit(self.limit + 1))
+        rows = list(result.scalars().all())
+        return rows[: self.limit], len(rows) > self.limit
 
     @abstractmethod
     async def handle(self, params: Dict[str, Any]) -> Dict[str, Any]:
@@ -52,14 +81,14 @@ class GetPeopleHandler(FunctionHandler):
         if search_params.importance:
             query = query.where(Person.importance == search_params.importance)
 
-        result = await self.db.execute(query)
-        people = result.scalars().all()
+        people, truncated = await self._fetch(query)
 
         return {
             "results": [
                 PersonSchema.model_validate(person).model_dump() for person in people
             ],
             "total": len(people),
+            "truncated": truncated,
         }
 
 
@@ -71,7 +100,9 @@ class GetTasksHandler(FunctionHandler):
         query = select(Task).where(Task.user_id == self.user_id)
 
         if search_params.query:
-            query = query.where(Task.description.ilike(f"%{search_params.query}%"))
+            query = await text_search(
+                self.db, query, "tasks", Task.description, search_params.query
+            )
         if search_params.type:
             query = query.where(Task.type == search_params.type)
         if search_params.status:
@@ -79,14 +110,20 @@ class GetTasksHandler(FunctionHandler):
         if search_params.priority:
             query = query.where(Task.priority == search_params.priority)
         if search_params.owner:
-            query = query.where(Task.people["owner"].astext == search_params.owner)
+            query = query.where(
+                Task.task_id.in_(
+                    linked_source_ids(
+                        "tasks", "people", self.user_id, search_params.owner, "owner"
+                    )
+                )
+            )
 
-        result = await self.db.execute(query)
-        tasks = result.scalars().all()
+        tasks, truncated = await self._fetch(query)
 
         return {
             "results": [TaskSchema.model_validate(task).model_dump() for task in tasks],
             "total": len(tasks),
+            "truncated": truncated,
         }
 
 
@@ -98,7 +135,9 @@ class GetTopicsHandler(FunctionHandler):
         query = select(Topic).where(Topic.user_id == self.user_id)
 
         if search_params.keyword:
-            query = query.where(Topic.keywords.contains([search_params.keyword]))
+            query = query.where(
+                json_array_contains(Topic.keywords, search_params.keyword)
+            )
         if search_params.name:
             query = query.where(Topic.name.ilike(f"%{search_params.name}%"))
         if search_params.description:
@@ -107,17 +146,24 @@ class GetTopicsHandler(FunctionHandler):
             )
         if search_params.related_person:
             query = query.where(
-                Topic.related_people.contains([search_params.related_person])
+                Topic.topic_id.in_(
+                    linked_source_ids(
+                        "topics",
+                        "related_people",
+                        self.user_id,
+                        search_params.related_person,
+                    )
+                )
             )
 
-        result = await self.db.execute(query)
-        topics = result.scalars().all()
+        topics, truncated = await self._fetch(query)
 
         return {
             "results": [
                 TopicSchema.model_validate(topic).model_dump() for topic in topics
             ],
             "total": len(topics),
+            "truncated": truncated,
         }
 
 
@@ -129,26 +175,49 @@ class GetNotesHandler(FunctionHandler):
         query = select(Note).where(Note.user_id == self.user_id)
 
         if search_params.query:
-            query = query.where(Note.content.ilike(f"%{search_params.query}%"))
+            query = await text_search(
+                self.db, query, "notes", Note.content, search_params.query
+            )
         if search_params.related_topic:
             query = query.where(
-                Note.related_topics.contains([search_params.related_topic])
+                Note.note_id.in_(
+                    linked_source_ids(
+                        "notes",
+                        "related_topics",
+                        self.user_id,
+                        search_params.related_topic,
+                    )
+                )
             )
         if search_params.related_person:
             query = query.where(
-                Note.related_people.contains([search_params.related_person])
+                Note.note_id.in_(
+                    linked_source_ids(
+                        "notes",
+                        "related_people",
+                        self.user_id,
+                        search_params.related_person,
+                    )
+                )
             )
         if search_params.related_task:
             query = query.where(
-                Note.related_tasks.contains([search_params.related_task])
+                Note.note_id.in_(
+                    linked_source_ids(
+                        "notes",
+                        "related_tasks",
+                        self.user_id,
+                        search_params.related_task,
+                    )
+                )
             )
 
-        result = await self.db.execute(query)
-        notes = result.scalars().all()
+        notes, truncated = await self._fetch(query)
 
         return {
             "results": [NoteSchema.model_validate(note).model_dump() for note in notes],
             "total": len(notes),
+            "truncated": truncated,
         }
 
 
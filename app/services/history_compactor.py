@@ -0,0 +1,128 @@
+"""
+Conversation history compaction for Sidekick prompts.
+
+Threads store every turn, including the full JSON of each assistant response.
+Before history is sent to the model it is compacted:
+- assistant JSON is replaced by its status, followup text and affected entity IDs
+  (the entity payloads are already persisted and reach the model as context)
+- the last SIDEKICK_HISTORY_WINDOW messages are kept as messages
+- older messages are folded into a rolling summary of bounded size, stored on the
+  thread; each message is folded in once, as it leaves the window
+"""
+
+import json
+from typing import List, Dict, Any, Optional
+from app.core.config import settings
+
+SUMMARY_HEADER = "Summary of earlier conversation in this thread:"
+SUMMARY_LINE_CHARS = 160
+SUMMARY_OMITTED_LINE = "- (older messages omitted)"
+
+
+def _parse_assistant_payload(content: str) -> Optional[Dict[str, Any]]:
+    try:
+        payload = json.loads(content)
+    except (json.JSONDecodeError, TypeError):
+        return None
+    if not isinstance(payload, dict) or not isinstance(
+        payload.get("instructions"), dict
+    ):
+        return None
+    return payload
+
+
+def _affected_ids(instructions: Dict[str, Any]) -> Dict[str, List[str]]:
+    affected = instructions.get("affected_entities") or {}
+    return {
+        entity_type: list(ids)
+        for entity_type, ids in affected.items()
+        if isinstance(ids, list) and ids
+    }
+
+
+def compact_assistant_content(content: str) -> str:
+    """Replace an assistant JSON turn with its followup and affected entity IDs"""
+    payload = _parse_assistant_payload(content)
+    if payload is None:
+        return content
+    instructions = payload["instructions"]
+    compact = {
+        "instructions": {
+            "status": instructions.get("status", ""),
+            "followup": instructions.get("followup", ""),
+            "affected_entities": _affected_ids(instructions),
+        }
+    }
+    return json.dumps(compact, ensure_ascii=False, separators=(",", ":"))
+
+
+def assistant_followup(content: str) -> str:
+    """The followup text of an assistant JSON turn, without its payload"""
+    payload = _parse_assistant_payload(content)
+    if payload is None:
+        return content
+    return str(payload["instructions"].get("followup", ""))
+
+
+def _summary_line(message: Dict[str, str]) -> str:
+    role = message.get("role", "user")
+    content = str(message.get("content", ""))
+    if role == "assistant" and (payload := _parse_assistant_payload(content)):
+        instructions = payload["instructions"]
+        content = str(instructions.get("followup", ""))
+        ids = _affected_ids(instructions)
+        if ids:
+            content += " (affected: " + "; ".join(
+                f"{entity_type} {', '.join(entity_ids)}"
+                for entity_type, entity_ids in ids.items()
+            )
+            content += ")"
+    content = " ".join(content.split())
+    if len(content) > SUMMARY_LINE_CHARS:
+        content = content[: SUMMARY_LINE_CHARS - 3] + "..."
+    return f"- {role}: {content}"
+
+
+def fold_into_summary(
+    summary: Optional[str],
+    messages: List[Dict[str, str]],
+    max_chars: int = settings.SIDEKICK_HISTORY_SUMMARY_MAX_CHARS,
+) -> str:
+    """
+    Add a line per message to a thread's summary, dropping the oldest lines
+    beyond max_chars (header included)
+    """
+    lines = summary.split("\n") if summary else []
+    omitted = bool(lines) and lines[0] == SUMMARY_OMITTED_LINE
+    if omitted:
+        lines = lines[1:]
+    lines += [_summary_line(message) for message in messages]
+
+    kept: List[str] = []
+    used = len(SUMMARY_HEADER) + len(SUMMARY_OMITTED_LINE) + 2
+    for line in reversed(lines):
+        if used + len(line) + 1 > max_chars:
+            break
+        kept.append(line)
+        used += len(line) + 1
+    if omitted or len(kept) < len(lines):
+        kept.append(SUMMARY_OMITTED_LINE)
+    return "\n".join(reversed(kept))
+
+
+def summary_message(summary: str) -> Dict[str, str]:
+    """The prompt message carrying a thread's summary"""
+    return {"role": "system", "content": f"{SUMMARY_HEADER}\n{summary}"}
+
+
+def compact_history(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Compact a thread's history for inclusion in a prompt"""
+    compacted: List[Dict[str, str]] = []
+    for message in messages:
+        if message.get("role") == "assistant":
+            message = {
+                **message,
+                "content": compact_assistant_content(str(message.get("content", ""))),
+            }
+        compacted.append(message)
+    return compacted
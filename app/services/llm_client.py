@@ -0,0 +1,117 @@
+"""
+Shared async OpenAI client for the Sidekick service.
+
+A single LLMClient is created at application startup and stored on app.state so
+every request reuses the same HTTP connection pool instead of building a fresh
+client (and TLS session) per call.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+import httpx
+from openai import AsyncOpenAI, RateLimitError
+from app.core.config import settings
+from app.services.llm_governor import LLMGovernor, Reservation
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LLMClient:
+    """App-lifetime async OpenAI client with pooled connections and a concurrency cap"""
+
+    def __init__(
+        self,
+        max_connections: int = settings.OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections: int = settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry: float = settings.OPENAI_KEEPALIVE_EXPIRY,
+        max_concurrency: int = settings.OPENAI_MAX_CONCURRENCY,
+        timeout: float = settings.OPENAI_TIMEOUT,
+        governor: Optional[LLMGovernor] = None,
+        base_url: Optional[str] = settings.OPENAI_BASE_URL,
+        api_key: Optional[str] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+    ) -> None:
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            timeout=timeout,
+            transport=transport,
+        )
+        # Retries are handled by SidekickService.call_openai_api
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=self.http_client,
+            max_retries=0,
+        )
+        self.max_concurrency = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.governor = governor or LLMGovernor()
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: int = 0) -> AsyncIterator[Reservation]:
+        """
+        Reserve rate budget for one call, then wait for one of the max_concurrency
+        in-flight request slots. Set actual_tokens on the yielded reservation from
+        response.usage so the token bucket is reconciled.
+        """
+        reservation = await self.governor.reserve(estimated_tokens)
+        try:
+            async with self._semaphore:
+                yield reservation
+        except RateLimitError as e:
+            await self.governor.block(_retry_after(e))
+            raise
+        finally:
+            await self.governor.settle(reservation)
+
+    async def close(self) -> None:
+        await self.client.close()
+
+
+def _retry_after(error: RateLimitError) -> float:
+    try:
+        return float(error.response.headers.get("retry-after", ""))
+    except (TypeError, ValueError):
+        return settings.OPENAI_RATE_LIMIT_BACKOFF
+
+
+_llm_client: Optional[LLMClient] = None
+
+
+async def init_llm_client() -> LLMClient:
+    """
+    Creates the shared LLM client on application startup.
+    """
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = LLMClient()
+        logger.info(
+            f"LLM client initialized (max_concurrency={_llm_client.max_concurrency})"
+        )
+    return _llm_client
+
+
+async def close_llm_client() -> None:
+    """
+    Closes the shared LLM client on application shutdown.
+    """
+    global _llm_client
+    if _llm_client:
+        await _llm_client.close()
+        _llm_client = None
+
+
+def get_shared_llm_client() -> LLMClient:
+    """
+    Returns the shared LLM client, creating it lazily when startup hooks have not run.
+    """
+    global _llm_client
+    if _llm_client is None:
+        _llm_client = LLMClient()
+    return _llm_client
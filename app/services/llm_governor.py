@@ -0,0 +1,228 @@
+"""
+Account-wide OpenAI rate governor shared by every worker.
+
+Two token buckets model the provider's requests-per-minute and tokens-per-minute
+limits. Before a call, one request and an estimate of its tokens are reserved;
+when the response arrives the reservation is reconciled with response.usage.
+A caller that does not fit waits (queued, with a deadline) until the buckets
+refill instead of sending a request that would be rejected with a 429. When the
+provider returns a 429 anyway, every worker pauses until its retry-after.
+
+The buckets live in Redis and are updated by Lua scripts so all workers share
+one budget. Without Redis the same algorithm runs per process.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass
+from typing import List, Dict, Any, Mapping, Optional, Sequence, Tuple
+from redis.exceptions import RedisError
+from app.core.config import settings
+from app.services.prompt_budget import estimate_prompt_tokens
+from utils.cache import get_redis_if_connected
+
+logger = logging.getLogger(__name__)
+
+RPM_KEY = "sidekick:governor:rpm"
+TPM_KEY = "sidekick:governor:tpm"
+BLOCKED_UNTIL_KEY = "sidekick:governor:blocked_until"
+BUCKET_EXPIRY_SECONDS = 120
+
+# KEYS: rpm bucket, tpm bucket, blocked-until
+# ARGV: now, rpm capacity, tpm capacity, requests, tokens
+# Returns "0" when reserved, otherwise the seconds to wait before trying again
+_RESERVE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local blocked = tonumber(redis.call('GET', KEYS[3]) or '0')
+if blocked > now then
+  return tostring(blocked - now)
+end
+local wait = 0
+local levels = {}
+for i = 1, 2 do
+  local capacity = tonumber(ARGV[i + 1])
+  local amount = tonumber(ARGV[i + 3])
+  if capacity > 0 then
+    local state = redis.call('HMGET', KEYS[i], 'level', 'ts')
+    local level = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    local rate = capacity / 60
+    level = math.min(capacity, level + math.max(0, now - ts) * rate)
+    levels[i] = level
+    local needed = math.min(amount, capacity)
+    if level < needed then
+      wait = math.max(wait, (needed - level) / rate)
+    end
+  end
+end
+if wait > 0 then
+  return tostring(wait)
+end
+for i = 1, 2 do
+  local capacity = tonumber(ARGV[i + 1])
+  if capacity > 0 then
+    redis.call('HSET', KEYS[i], 'level', levels[i] - tonumber(ARGV[i + 3]), 'ts', now)
+    redis.call('EXPIRE', KEYS[i], %(expiry)d)
+  end
+end
+return '0'
+""" % {"expiry": BUCKET_EXPIRY_SECONDS}
+
+# KEYS: bucket. ARGV: now, capacity, delta (positive refunds, negative debits)
+_ADJUST_SCRIPT = """
+local now = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local state = redis.call('HMGET', KEYS[1], 'level', 'ts')
+local level = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+level = math.min(capacity, level + math.max(0, now - ts) * capacity / 60 + tonumber(ARGV[3]))
+redis.call('HSET', KEYS[1], 'level', level, 'ts', now)
+redis.call('EXPIRE', KEYS[1], %(expiry)d)
+return tostring(level)
+""" % {"expiry": BUCKET_EXPIRY_SECONDS}
+
+# KEYS: blocked-until. ARGV: until (only ever moves forward)
+_BLOCK_SCRIPT = """
+local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+local target = tonumber(ARGV[1])
+if target > current then
+  redis.call('SET', KEYS[1], ARGV[1], 'EX', math.ceil(ARGV[2]))
+end
+return 'OK'
+"""
+
+
+class GovernorTimeoutError(Exception):
+    """Raised when a call cannot be scheduled within the governor deadline"""
+
+
+@dataclass
+class Reservation:
+    """Budget held for one call; set actual_tokens from response.usage"""
+
+    tokens: int
+    actual_tokens: Optional[int] = None
+
+
+def estimate_request_tokens(
+    messages: Sequence[Mapping[str, Any]],
+    completion_tokens: int = settings.OPENAI_COMPLETION_TOKEN_RESERVE,
+) -> int:
+    """Estimated prompt size plus the expected completion"""
+    return estimate_prompt_tokens(messages) + completion_tokens
+
+
+class _LocalBuckets:
+    """In-process twin of the Redis scripts, used when Redis is unavailable"""
+
+    def __init__(self) -> None:
+        self.levels: Dict[str, Tuple[float, float]] = {}
+        self.blocked_until = 0.0
+
+    def _level(self, key: str, capacity: int, now: float) -> float:
+        level, ts = self.levels.get(key, (float(capacity), now))
+        return min(capacity, level + max(0.0, now - ts) * capacity / 60)
+
+    def reserve(
+        self, now: float, rpm: int, tpm: int, requests: int, tokens: int
+    ) -> float:
+        if self.blocked_until > now:
+            return self.blocked_until - now
+        buckets = ((RPM_KEY, rpm, requests), (TPM_KEY, tpm, tokens))
+        wait = 0.0
+        for key, capacity, amount in buckets:
+            if capacity > 0:
+                level = self._level(key, capacity, now)
+                needed = min(amount, capacity)
+                if level < needed:
+                    wait = max(wait, (needed - level) / (capacity / 60))
+        if wait > 0:
+            return wait
+        for key, capacity, amount in buckets:
+            if capacity > 0:
+                self.levels[key] = (self._level(key, capacity, now) - amount, now)
+        return 0.0
+
+    def adjust(self, key: str, capacity: int, delta: float, now: float) -> None:
+        level = min(capacity, self._level(key, capacity, now) + delta)
+        self.levels[key] = (level, now)
+
+    def block(self, until: float) -> None:
+        self.blocked_until = max(self.blocked_until, until)
+
+
+class LLMGovernor:
+    """RPM/TPM token buckets shared through Redis, with a per-process fallback"""
+
+    def __init__(
+        self,
+        rpm_limit: int = settings.OPENAI_RPM_LIMIT,
+        tpm_limit: int = settings.OPENAI_TPM_LIMIT,
+        max_wait: float = settings.OPENAI_GOVERNOR_MAX_WAIT,
+    ) -> None:
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.max_wait = max_wait
+        self._local = _LocalBuckets()
+
+    async def _eval(self, script: str, keys: List[str], args: List[Any]) -> Any:
+        client = get_redis_if_connected()
+        if client is None:
+            return None
+        try:
+            return await client.eval(script, len(keys), *keys, *args)
+        except RedisError as e:
+            logger.warning(f"LLM governor falling back to local buckets: {str(e)}")
+            return None
+
+    async def _try_reserve(self, tokens: int) -> float:
+        now = time.time()
+        result = await self._eval(
+            _RESERVE_SCRIPT,
+            [RPM_KEY, TPM_KEY, BLOCKED_UNTIL_KEY],
+            [now, self.rpm_limit, self.tpm_limit, 1, tokens],
+        )
+        if result is None:
+            return self._local.reserve(now, self.rpm_limit, self.tpm_limit, 1, tokens)
+        return float(result)
+
+    async def reserve(self, tokens: int) -> Reservation:
+        """Wait until one request and tokens fit in the buckets, then take them"""
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            wait = await self._try_reserve(tokens)
+            if wait <= 0:
+                return Reservation(tokens=tokens)
+            remaining = deadline - time.monotonic()
+            if wait > remaining:
+                raise GovernorTimeoutError(
+                    f"OpenAI rate limit budget unavailable for {self.max_wait:.0f}s"
+                )
+            # Jitter spreads waiting workers so they do not retry in lockstep
+            await asyncio.sleep(wait + random.uniform(0, min(0.25, wait)))
+
+    async def settle(self, reservation: Reservation) -> None:
+        """Refund or charge the difference between estimated and actual tokens"""
+        if self.tpm_limit <= 0:
+            return
+        actual = reservation.actual_tokens if reservation.actual_tokens else 0
+        delta = reservation.tokens - actual
+        if not delta:
+            return
+        now = time.time()
+        result = await self._eval(
+            _ADJUST_SCRIPT, [TPM_KEY], [now, self.tpm_limit, delta]
+        )
+        if result is None:
+            self._local.adjust(TPM_KEY, self.tpm_limit, delta, now)
+
+    async def block(self, seconds: float) -> None:
+        """Pause all callers for seconds, e.g. after a provider 429"""
+        until = time.time() + seconds
+        result = await self._eval(
+            _BLOCK_SCRIPT, [BLOCKED_UNTIL_KEY], [until, max(seconds, 1)]
+        )
+        if result is None:
+            self._local.block(until)
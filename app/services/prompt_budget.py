@@ -0,0 +1,165 @@
+"""
+Pre-flight prompt token estimation and trimming for Sidekick.
+
+Prompt size is estimated locally before the OpenAI call: with tiktoken once
+init_tokenizer has loaded its encoding at startup (off the event loop, since it
+may be downloaded), otherwise at ~4 characters per token. When a legacy prompt
+is over SIDEKICK_PROMPT_TOKEN_BUDGET it is trimmed deterministically instead of
+failing after a round trip:
+1. the oldest history messages (the current user message is always kept)
+2. context entities, lowest priority type first (notes, topics, tasks, people),
+   dropping the last entity of a type first
+The system prompt is never trimmed; a prompt still over budget with nothing
+left to drop is rejected with a 413. v2 prompts carry no context, so only their
+older history is dropped (trim_history_to_budget).
+"""
+
+import asyncio
+import json
+import logging
+from typing import List, Dict, Any, Mapping, Optional, Sequence, TypeVar
+from fastapi import HTTPException
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+Message = TypeVar("Message", bound=Mapping[str, Any])
+
+# Context entity types in the order they are dropped
+CONTEXT_TRIM_ORDER = ("notes", "topics", "tasks", "people")
+
+# Per-message framing tokens in the chat format, plus the reply primer
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMER_TOKENS = 3
+
+
+_encoding: Optional[Any] = None
+
+
+def _load_encoding() -> Optional[Any]:
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(settings.SIDEKICK_TOKENIZER_ENCODING)
+    except Exception as e:
+        # Not installed, or the encoding file cannot be fetched (offline)
+        logger.warning(f"tiktoken unavailable, estimating tokens by length: {str(e)}")
+        return None
+
+
+async def init_tokenizer() -> None:
+    """
+    Loads the tiktoken encoding in a thread on application startup.
+    """
+    global _encoding
+    _encoding = await asyncio.to_thread(_load_encoding)
+
+
+def count_text_tokens(text: str) -> int:
+    if _encoding is None:
+        return (len(text) + 3) // 4
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def estimate_message_tokens(message: Mapping[str, Any]) -> int:
+    return MESSAGE_OVERHEAD_TOKENS + count_text_tokens(str(message.get("content", "")))
+
+
+def estimate_prompt_tokens(messages: Sequence[Mapping[str, Any]]) -> int:
+    """Estimated prompt_tokens OpenAI will report for messages"""
+    return REPLY_PRIMER_TOKENS + sum(estimate_message_tokens(m) for m in messages)
+
+
+def context_message(context: Dict[str, List[Dict[str, Any]]]) -> Dict[str, str]:
+    """The user message that carries the serialized context"""
+    sanitized_context = json.dumps(context, ensure_ascii=False, default=str)
+    return {"role": "user", "content": f"Current context: {sanitized_context}"}
+
+
+def trim_history_to_budget(
+    messages: List[Message], budget: int = settings.SIDEKICK_PROMPT_TOKEN_BUDGET
+) -> List[Message]:
+    """
+    Drop the oldest messages between the leading system messages and the latest
+    user message until the estimate fits budget (0 disables trimming). The
+    current turn, including any tool calls and results, is kept whole.
+    """
+    if budget <= 0:
+        return messages
+    estimate = estimate_prompt_tokens(messages)
+    if estimate <= budget:
+        return messages
+
+    start = 0
+    while start < len(messages) and messages[start].get("role") == "system":
+        start += 1
+    end = max(
+        (i for i, m in enumerate(messages) if m.get("role") == "user"), default=start
+    )
+    dropped = 0
+    while estimate > budget and start + dropped < end:
+        estimate -= estimate_message_tokens(messages[start + dropped])
+        dropped += 1
+    if dropped:
+        logger.warning(
+            f"Prompt trimmed to {estimate} estimated tokens (budget {budget}): "
+            f"dropped {dropped} history messages"
+        )
+    return messages[:start] + messages[start + dropped :]
+
+
+def fit_prompt_to_budget(
+    head: List[Dict[str, str]],
+    context: Dict[str, List[Dict[str, Any]]],
+    history: List[Dict[str, str]],
+    budget: int = settings.SIDEKICK_PROMPT_TOKEN_BUDGET,
+) -> List[Dict[str, str]]:
+    """
+    Assemble head + context message + history, trimming history and then context
+    until the estimate fits budget (0 disables trimming). Raises a 413
+    HTTPException when the prompt does not fit even with only the current
+    message left.
+    """
+    messages = head + [context_message(context)] + history
+    if budget <= 0:
+        return messages
+    estimate = estimate_prompt_tokens(messages)
+    if estimate <= budget:
+        return messages
+
+    history = list(history)
+    context = {entity_type: list(items) for entity_type, items in context.items()}
+    dropped_history = 0
+    dropped_entities: Dict[str, int] = {}
+    while estimate > budget:
+        if len(history) <= 1 and not any(context.get(t) for t in CONTEXT_TRIM_ORDER):
+            raise HTTPException(
+                status_code=413,
+                detail=f"Prompt needs about {estimate} tokens, over the budget of "
+                f"{budget} even without history or context",
+            )
+        while estimate > budget and len(history) > 1:
+            estimate -= estimate_message_tokens(history.pop(0))
+            dropped_history += 1
+        for entity_type in CONTEXT_TRIM_ORDER:
+            entities = context.get(entity_type, [])
+            while estimate > budget and entities:
+                entity = entities.pop()
+                # The entity's JSON plus its separator in the context list
+                estimate -= (
+                    count_text_tokens(
+                        json.dumps(entity, ensure_ascii=False, default=str)
+                    )
+                    + 1
+                )
+                dropped_entities[entity_type] = dropped_entities.get(entity_type, 0) + 1
+        # Per-entity costs only approximate the serialized context, so check the
+        # assembled prompt and keep trimming if it is still over
+        messages = head + [context_message(context)] + history
+        estimate = estimate_prompt_tokens(messages)
+
+    logger.warning(
+        f"Prompt trimmed to {estimate} estimated tokens (budget {budget}): "
+        f"dropped {dropped_history} history messages and entities {dropped_entities}"
+    )
+    return messages
@@ -0,0 +1,109 @@
+"""
+Exact-match cache for Sidekick LLM responses.
+
+Responses are keyed by a hash of the model, the sanitized prompt messages and the
+response format. Because the prompt embeds the user's context, an entity change
+produces a different key. Responses that ask for a write are never stored, so a
+cache hit can never replay a mutation.
+
+Entries live in Redis with a TTL. A sorted-set index of insertion times caps the
+number of entries by evicting the oldest ones. Hit and miss counters are kept in
+Redis as well.
+"""
+
+import hashlib
+import json
+import logging
+import time
+from typing import Dict, Any, Mapping, Optional, Sequence, Tuple
+from redis.exceptions import RedisError
+from app.core.config import settings
+from utils.cache import get_redis_if_connected
+
+logger = logging.getLogger(__name__)
+
+ENTRY_KEY = "sidekick:llm_cache:entry:{digest}"
+INDEX_KEY = "sidekick:llm_cache:index"
+HITS_KEY = "sidekick:llm_cache:hits"
+MISSES_KEY = "sidekick:llm_cache:misses"
+
+
+def response_cache_key(
+    model: str,
+    messages: Sequence[Mapping[str, Any]],
+    response_format: Mapping[str, Any],
+) -> str:
+    """Stable key for one completion request"""
+    payload = json.dumps(
+        {"model": model, "messages": messages, "response_format": response_format},
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return ENTRY_KEY.format(digest=hashlib.sha256(payload.encode()).hexdigest())
+
+
+async def get_cached_response(key: str) -> Optional[Tuple[str, Dict[str, int]]]:
+    """Return (raw response, token usage) for key and count the hit or miss"""
+    client = get_redis_if_connected()
+    if client is None:
+        return None
+    try:
+        value = await client.get(key)
+        await client.incr(HITS_KEY if value is not None else MISSES_KEY)
+        if value is None:
+            return None
+        entry = json.loads(value)
+        return entry["response"], entry["usage"]
+    except (RedisError, ValueError, KeyError, TypeError) as e:
+        logger.warning(f"LLM response cache read failed: {str(e)}")
+        return None
+
+
+async def store_response(
+    key: str,
+    raw_response: str,
+    usage: Dict[str, int],
+    ttl: int = settings.SIDEKICK_RESPONSE_CACHE_TTL,
+    max_entries: int = settings.SIDEKICK_RESPONSE_CACHE_MAX_ENTRIES,
+) -> None:
+    """Store a response and evict the oldest entries beyond max_entries"""
+    client = get_redis_if_connected()
+    if client is None:
+        return
+    now = time.time()
+    try:
+        await client.set(
+            key, json.dumps({"response": raw_response, "usage": usage}), ex=ttl
+        )
+        await client.zadd(INDEX_KEY, {key: now})
+        await client.zremrangebyscore(INDEX_KEY, "-inf", now - ttl)
+        overflow = await client.zcard(INDEX_KEY) - max_entries
+        if overflow > 0:
+            evicted = await client.zpopmin(INDEX_KEY, overflow)
+            await client.delete(*[member for member, _ in evicted])
+    except RedisError as e:
+        logger.warning(f"LLM response cache write failed: {str(e)}")
+
+
+async def get_response_cache_stats() -> Dict[str, Any]:
+    """Hit/miss counters and current entry count"""
+    stats: Dict[str, Any] = {
+        "enabled": settings.SIDEKICK_RESPONSE_CACHE,
+        "hits": 0,
+        "misses": 0,
+        "entries": 0,
+    }
+    client = get_redis_if_connected()
+    if client is None:
+        return stats
+    try:
+        hits, misses = await client.mget(HITS_KEY, MISSES_KEY)
+        stats["hits"] = int(hits or 0)
+        stats["misses"] = int(misses or 0)
+        stats["entries"] = await client.zcard(INDEX_KEY)
+    except (RedisError, ValueError) as e:
+        logger.warning(f"LLM response cache stats failed: {str(e)}")
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
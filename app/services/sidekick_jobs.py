@@ -0,0 +1,197 @@
+"""
+Asynchronous job mode for Sidekick.
+
+/ask with mode="async" persists the request as a SidekickJob and returns 202 with
+the job id. A bounded pool of workers per process runs SidekickService.process_input
+for queued jobs, stores the SidekickOutput on the job and pushes it to the user's
+WebSocket via WebSocketManager.send_system_message. Clients that are not
+connected (or whose socket lives on another worker) poll GET /jobs/{id}.
+
+A running job's updated_at is refreshed every SIDEKICK_JOB_HEARTBEAT_SECONDS.
+Unfinished jobs are re-queued at startup, and every SIDEKICK_JOB_SWEEP_SECONDS
+each process re-queues jobs not updated for SIDEKICK_JOB_STALE_SECONDS, so a job
+whose process died is picked up by a live one. Workers claim a job atomically
+before running it, so a job queued by several processes still runs once.
+"""
+
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta, UTC
+from typing import Any, Dict, List, Optional
+from fastapi import HTTPException
+from app.core.config import settings
+from app.db.operations import (
+    claim_sidekick_job,
+    get_sidekick_job,
+    get_unfinished_sidekick_jobs,
+    touch_sidekick_job,
+    update_sidekick_job,
+)
+from app.schemas.sidekick_schema import SidekickInput
+from app.services.llm_client import LLMClient, get_shared_llm_client
+from app.services.sidekick_service import SidekickService
+from app.services.websocket_manager import WebSocketManager
+from utils.database import get_session
+
+logger = logging.getLogger(__name__)
+
+
+def _stale_before() -> str:
+    return (
+        datetime.now(UTC) - timedelta(seconds=settings.SIDEKICK_JOB_STALE_SECONDS)
+    ).isoformat()
+
+
+class SidekickJobQueue:
+    """In-process queue of job ids drained by a fixed number of worker tasks"""
+
+    def __init__(
+        self,
+        llm_client: Optional[LLMClient] = None,
+        websocket_manager: Optional[WebSocketManager] = None,
+        workers: int = settings.SIDEKICK_JOB_WORKERS,
+        heartbeat: float = settings.SIDEKICK_JOB_HEARTBEAT_SECONDS,
+        sweep_interval: float = settings.SIDEKICK_JOB_SWEEP_SECONDS,
+    ) -> None:
+        self.llm_client = llm_client or get_shared_llm_client()
+        self.websocket_manager = websocket_manager
+        self.worker_count = max(workers, 1)
+        self.heartbeat = heartbeat
+        self.sweep_interval = sweep_interval
+        self._queue: Optional["asyncio.Queue[str]"] = None
+        self._workers: List["asyncio.Task[None]"] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_started(self) -> "asyncio.Queue[str]":
+        loop = asyncio.get_running_loop()
+        if self._queue is None or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._workers = [
+                asyncio.create_task(self._worker(self._queue))
+                for _ in range(self.worker_count)
+            ]
+            self._workers.append(asyncio.create_task(self._sweeper()))
+        return self._queue
+
+    async def start(self) -> None:
+        """Start the workers and re-queue jobs a previous process left unfinished"""
+        self._ensure_started()
+        async with get_session() as db:
+            unfinished = await get_unfinished_sidekick_jobs(db)
+        for job in unfinished:
+            await self.submit(job.id)
+        if unfinished:
+            logger.info(f"Re-queued {len(unfinished)} unfinished sidekick jobs")
+
+    async def stop(self) -> None:
+        """Cancel the workers; queued jobs stay pending in the database"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    async def sweep(self) -> int:
+        """Re-queue jobs whose worker stopped updating them; returns how many"""
+        async with get_session() as db:
+            stale = await get_unfinished_sidekick_jobs(db, _stale_before())
+        for job in stale:
+            await self.submit(job.id)
+        if stale:
+            logger.info(f"Re-queued {len(stale)} stale sidekick jobs")
+        return len(stale)
+
+    async def _sweeper(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Sweeping stale sidekick jobs failed: {str(e)}")
+
+    async def _heartbeat(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            try:
+                async with get_session() as db:
+                    await touch_sidekick_job(db, job_id)
+            except Exception as e:
+                logger.warning(f"Heartbeat for sidekick job {job_id} failed: {str(e)}")
+
+    async def submit(self, job_id: str) -> None:
+        await self._ensure_started().put(job_id)
+
+    async def join(self) -> None:
+        """Wait until every submitted job has been processed"""
+        await self._ensure_started().join()
+
+    async def _worker(self, queue: "asyncio.Queue[str]") -> None:
+        while True:
+            job_id = await queue.get()
+            try:
+                await self.run_job(job_id)
+            except Exception as e:
+                logger.error(f"Sidekick job {job_id} crashed: {str(e)}")
+            finally:
+                queue.task_done()
+
+    async def run_job(self, job_id: str) -> None:
+        """Run one job to completion and notify its owner"""
+        async with get_session() as db:
+            if not await claim_sidekick_job(db, job_id, _stale_before()):
+                return
+            job = await get_sidekick_job(db, job_id)
+            if job is None:
+                return
+            user_id, request = job.user_id, job.request
+
+        # No session is held during the turn, which opens its own
+        result: Optional[Dict[str, Any]] = None
+        error: Optional[str] = None
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            sidekick_input = SidekickInput.model_validate(request)
+            output = await SidekickService(self.llm_client).process_input(
+                user_id, sidekick_input
+            )
+            result = output.model_dump()
+        except HTTPException as e:
+            error = str(e.detail)
+        except Exception as e:
+            logger.error(f"Error running sidekick job {job_id}: {str(e)}")
+            error = f"An error occurred: {str(e)}"
+        finally:
+            heartbeat.cancel()
+
+        status = "completed" if error is None else "failed"
+        async with get_session() as db:
+            await update_sidekick_job(db, job_id, status, result=result, error=error)
+        logger.info(f"Sidekick job {job_id} {status}")
+        await self._notify(user_id, job_id, status, result, error)
+
+    async def _notify(
+        self,
+        user_id: str,
+        job_id: str,
+        status: str,
+        result: Optional[Dict[str, Any]],
+        error: Optional[str],
+    ) -> None:
+        if self.websocket_manager is None:
+            return
+        message = {
+            "event": "sidekick_job",
+            "job_id": job_id,
+            "status": status,
+            "result": result,
+            "error": error,
+        }
+        try:
+            await self.websocket_manager.send_system_message(
+                user_id, json.dumps(message, default=str)
+            )
+        except Exception as e:
+            # The result stays available through GET /jobs/{id}
+            logger.warning(f"Failed to push sidekick job {job_id}: {str(e)}")
@@ -1,11 +1,76 @@
 import json
-from typing import List, Dict, Any, Optional, cast, Tuple, Literal
-from openai import OpenAI
+from typing import (
+    List,
+    Dict,
+    Any,
+    Optional,
+    cast,
+    Tuple,
+    Literal,
+    AsyncGenerator,
+    Awaitable,
+    Callable,
+    Sequence,
+)
 from sqlalchemy.exc import SQLAlchemyError
 from pydantic import ValidationError
 import asyncio
+import uuid
+from contextlib import aclosing
 from nanoid import generate
+from openai import BadRequestError
+from openai.types.chat import (
+    ChatCompletionMessageParam,
+    ChatCompletionToolParam,
+)
+from openai.types.shared_params import FunctionDefinition, ResponseFormatJSONObject
 from app.core.config import settings
+from app.services.llm_client import LLMClient, get_shared_llm_client
+from app.services.llm_governor import GovernorTimeoutError, estimate_request_tokens
+from app.services.prompt_budget import (
+    count_text_tokens,
+    estimate_prompt_tokens,
+    fit_prompt_to_budget,
+    trim_history_to_budget,
+)
+from app.services.stream_parser import LLMResponseStreamParser, StreamEvent
+from app.services.function_handlers import FUNCTION_HANDLERS
+from app.services.context_selector import select_relevant_context
+from app.services.history_compactor import (
+    compact_history,
+    fold_into_summary,
+    summary_message,
+)
+from app.services.turn_coordinator import (
+    single_flight,
+    submission_key,
+    thread_lock,
+)
+from app.services.background_tasks import (
+    drain_thread_tasks,
+    get_background_task_queue,
+    register_task_handler,
+    thread_group,
+)
+from app.services.turn_timing import (
+    current_turn_timer,
+    record_turn_timings,
+    timed_stage,
+    turn_timing,
+)
+from app.services.response_cache import (
+    get_cached_response,
+    response_cache_key,
+    store_response,
+)
+from app.schemas.openai_functions import FUNCTION_DEFINITIONS
+from utils.database import get_session
+from utils.cache import (
+    CONTEXT_SNAPSHOT_KEY,
+    cache_get_json,
+    cache_set_json,
+    get_entity_version,
+)
 from app.schemas.sidekick_schema import (
     SidekickInput,
     SidekickOutput,
@@ -22,8 +87,10 @@ from dataclasses import dataclass
 from app.models import SidekickThread
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.operations import (
+    get_sidekick_messages,
+    get_sidekick_messages_between,
     get_sidekick_thread,
-    update_sidekick_thread,
+    append_sidekick_messages,
     create_sidekick_thread,
     create_person,
     update_person,
@@ -41,6 +108,12 @@ from app.db.operations import (
     get_tasks_for_user,
     get_topics_for_user,
     get_notes_for_user,
+    get_people_by_ids,
+    get_tasks_by_ids,
+    get_topics_by_ids,
+    get_notes_by_ids,
+    bulk_upsert_entities,
+    update_thread_summary,
 )
 from app.schemas.sidekick_schema import (
     SidekickThreadCreate,
@@ -56,6 +129,59 @@ from datetime import datetime, UTC
 
 logger = logging.getLogger(__name__)
 
+V2_CONTEXT_INSTRUCTIONS = (
+    "The user's existing people, tasks, topics and notes are not included in this "
+    "conversation. Call the available functions (get_people, get_tasks, get_topics, "
+    "get_notes) to look up the entities you need, reuse their IDs when updating "
+    "them, and then reply in the JSON response format described above."
+)
+
+# Create schema and to_dict method for each entity type written by the LLM
+ENTITY_WRITE_CONFIG: Dict[str, Tuple[Any, str]] = {
+    "people": (PersonCreate, "person_to_dict"),
+    "tasks": (TaskCreate, "task_to_dict"),
+    "topics": (TopicCreate, "topic_to_dict"),
+    "notes": (NoteCreate, "note_to_dict"),
+}
+
+
+def _usage_total_tokens(usage: Any) -> Optional[int]:
+    """Total tokens from a completion's usage, if the provider reported it"""
+    total = getattr(usage, "total_tokens", None)
+    return total if isinstance(total, int) else None
+
+
+PERSIST_HISTORY_TASK = "sidekick.persist_history"
+CREATE_THREAD_TASK = "sidekick.create_thread"
+
+
+async def _persist_history_task(db: AsyncSession, payload: Dict[str, Any]) -> None:
+    """Deferred history append, committed with the task's deletion"""
+    # Tasks queued before the request path stopped reading the seq carry start_seq
+    await append_sidekick_messages(
+        db, payload["thread_id"], payload["messages"], payload.get("start_seq")
+    )
+
+
+async def _create_thread_task(db: AsyncSession, payload: Dict[str, Any]) -> None:
+    """Deferred creation of the next thread under an ID already sent to the client"""
+    if await get_sidekick_thread(db, payload["thread_id"]) is None:
+        await create_sidekick_thread(
+            db,
+            SidekickThreadCreate(user_id=payload["user_id"]),
+            thread_id=payload["thread_id"],
+        )
+
+
+register_task_handler(PERSIST_HISTORY_TASK, _persist_history_task)
+register_task_handler(CREATE_THREAD_TASK, _create_thread_task)
+
+
+def _log_prompt_estimate(estimated_tokens: int, usage: Any) -> None:
+    """Log the local estimate next to the billed count to calibrate the estimator"""
+    actual = getattr(usage, "prompt_tokens", None)
+    logger.info(f"Prompt tokens estimated {estimated_tokens}, actual {actual}")
+
 
 class EntityProcessingError(Exception):
     """Custom exception for entity processing errors"""
@@ -68,14 +194,16 @@ class EntityProcessingError(Exception):
 
 
 class SidekickService:
-    def __init__(self) -> None:
-        self.client = OpenAI()
+    def __init__(self, llm_client: Optional[LLMClient] = None) -> None:
+        self.llm_client = llm_client or get_shared_llm_client()
+        self.client = self.llm_client.client
 
     async def fetch_entities_by_ids(
         self, db: AsyncSession, affected_entities: Dict[str, List[str]], user_id: str
     ) -> Dict[str, List[Dict[str, Any]]]:
         """
-        Fetch full entity objects based on their IDs from affected_entities with user ownership validation
+        Fetch full entity objects for the IDs in affected_entities, one query per
+        entity type scoped to the user, keeping the order of each ID list
         """
         entities: Dict[str, List[Dict[str, Any]]] = {
             "people": [],
@@ -87,147 +215,357 @@ class SidekickService:
             f"Starting fetch_entities_by_ids with affected_entities: {affected_entities}"
         )
 
-        # Helper function to safely fetch and validate entity ownership
-        async def safe_fetch_entity(
-            entity_type: str, entity_id: str, fetch_func: Any, convert_func: Any
-        ) -> Optional[Dict[str, Any]]:
+        loaders: Dict[
+            str,
+            Tuple[
+                Callable[[AsyncSession, str, List[str]], Awaitable[Sequence[Any]]],
+                str,
+                Callable[[Any], Dict[str, Any]],
+            ],
+        ] = {
+            "people": (get_people_by_ids, "person_id", self.person_to_dict),
+            "tasks": (get_tasks_by_ids, "task_id", self.task_to_dict),
+            "topics": (get_topics_by_ids, "topic_id", self.topic_to_dict),
+            "notes": (get_notes_by_ids, "note_id", self.note_to_dict),
+        }
+        for entity_type, (load_func, id_field, convert_func) in loaders.items():
+            entity_ids = affected_entities.get(entity_type) or []
+            if not entity_ids:
+                continue
             try:
-                if entity := await fetch_func(db, entity_id):
-                    # Check if entity belongs to current user
-                    if hasattr(entity, "user_id") and entity.user_id == user_id:
-                        return cast(Dict[str, Any], convert_func(entity))
-                    else:
-                        logger.warning(
-                            f"{entity_type} {entity_id} does not belong to user {user_id}"
-                        )
-                return None
-            except Exception as e:
-                logger.error(f"Error fetching {entity_type} {entity_id}: {str(e)}")
-                return None
-
-        # Log person fetching specifically
-        person_ids = affected_entities.get("people", [])
-        logger.info(f"Attempting to fetch people with IDs: {person_ids}")
+                found = {
+                    getattr(entity, id_field): entity
+                    for entity in await load_func(db, user_id, entity_ids)
+                }
+            except SQLAlchemyError as e:
+                logger.error(f"Database error fetching {entity_type}: {str(e)}")
+                continue
 
-        # Fetch each type of entity with ownership validation
-        for person_id in person_ids:
-            try:
-                if person := await get_person(db, person_id):
-                    # Check if person belongs to current user
-                    if person.user_id == user_id:
-                        logger.info(f"Successfully fetched person: {person}")
-                        person_dict = self.person_to_dict(person)
-                        logger.info(f"Converted person to dict: {person_dict}")
-                        entities["people"].append(person_dict)
-                    else:
-                        logger.warning(
-                            f"Person {person_id} does not belong to user {user_id}"
-                        )
-                else:
-                    logger.warning(f"No person found for ID: {person_id}")
-            except Exception as e:
-                logger.error(f"Error fetching person {person_id}: {str(e)}")
-
-        for task_id in affected_entities.get("tasks", []):
-            if result := await safe_fetch_entity(
-                "task", task_id, get_task, self.task_to_dict
-            ):
-                entities["tasks"].append(result)
-
-        for topic_id in affected_entities.get("topics", []):
-            if result := await safe_fetch_entity(
-                "topic", topic_id, get_topic, self.topic_to_dict
-            ):
-                entities["topics"].append(result)
-
-        for note_id in affected_entities.get("notes", []):
-            if result := await safe_fetch_entity(
-                "note", note_id, get_note, self.note_to_dict
-            ):
-                entities["notes"].append(result)
+            for entity_id in entity_ids:
+                entity = found.get(entity_id)
+                if entity is None:
+                    logger.warning(
+                        f"{entity_type} {entity_id} not found for user {user_id}"
+                    )
+                    continue
+                try:
+                    entities[entity_type].append(convert_func(entity))
+                except Exception as e:
+                    logger.error(
+                        f"Error converting {entity_type} {entity_id}: {str(e)}"
+                    )
 
         logger.info(f"Final entities after fetching: {entities}")
         return entities
 
     async def process_input(
+        self, user_id: str, sidekick_input: SidekickInput
+    ) -> SidekickOutput:
+        """
+        Main entry point for processing user input. The turn is shared with
+        identical in-flight submissions and may outlive the caller, so it runs
+        in its own session.
+        """
+        key = self._submission_key(user_id, sidekick_input)
+        return await single_flight(
+            key, lambda: self._process_input_serialized(user_id, sidekick_input, key)
+        )
+
+    def _submission_key(self, user_id: str, sidekick_input: SidekickInput) -> str:
+        return submission_key(
+            user_id,
+            sidekick_input.thread_id,
+            sidekick_input.user_input,
+            self._resolve_engine(sidekick_input),
+        )
+
+    async def _process_input_serialized(
+        self, user_id: str, sidekick_input: SidekickInput, key: str
+    ) -> SidekickOutput:
+        """Run one turn while holding the thread lock"""
+        async with thread_lock(sidekick_input.thread_id or key):
+            async with get_session() as db:
+                return await self._process_turn(db, user_id, sidekick_input)
+
+    async def _process_turn(
         self, db: AsyncSession, user_id: str, sidekick_input: SidekickInput
     ) -> SidekickOutput:
-        """Main entry point for processing user input"""
+        """Read the thread, call the model and persist the turn"""
         try:
-            # Handle conversation thread
+            with turn_timing():
+                # Handle conversation thread
+                thread, updated_history = await self._handle_conversation_thread(
+                    db, user_id, sidekick_input
+                )
+
+                # Get LLM response
+                processed_response, token_usage = await self._get_llm_response(
+                    db, user_id, updated_history, self._resolve_engine(sidekick_input)
+                )
+
+                return await self._complete_turn(
+                    db,
+                    user_id,
+                    thread,
+                    updated_history,
+                    processed_response,
+                    token_usage,
+                )
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error in process_input: {str(e)}")
+            raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+
+    async def process_input_stream(
+        self, db: AsyncSession, user_id: str, sidekick_input: SidekickInput
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        Streaming variant of process_input.
+
+        Yields "followup" events with text deltas as tokens arrive, "entity" events
+        for each data entity once it is complete, and a final "done" event carrying
+        the full SidekickOutput (or an "error" event).
+        """
+        key = self._submission_key(user_id, sidekick_input)
+        try:
+            with turn_timing():
+                async with aclosing(
+                    self._stream_turn(db, user_id, sidekick_input, key)
+                ) as events:
+                    async for event in events:
+                        yield event
+        except HTTPException as e:
+            yield {"event": "error", "data": {"detail": e.detail}}
+        except Exception as e:
+            logger.error(f"Error in process_input_stream: {str(e)}")
+            yield {"event": "error", "data": {"detail": f"An error occurred: {str(e)}"}}
+
+    async def _stream_turn(
+        self, db: AsyncSession, user_id: str, sidekick_input: SidekickInput, key: str
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """Stream one turn while holding the thread lock"""
+        async with thread_lock(sidekick_input.thread_id or key):
             thread, updated_history = await self._handle_conversation_thread(
                 db, user_id, sidekick_input
             )
+            if self._resolve_engine(sidekick_input) == "v2":
+                # Tool rounds are not streamed; replay the final answer as events
+                with timed_stage("llm"):
+                    llm_response, token_usage = await self.call_openai_api_with_tools(
+                        db, user_id, self.construct_prompt_v2(updated_history)
+                    )
+                for event in LLMResponseStreamParser().feed(
+                    llm_response.model_dump_json()
+                ):
+                    yield self._stream_event(event)
+            else:
+                prompt = await self._build_prompt(db, user_id, updated_history)
+                sanitized_prompt = self._sanitize_messages(prompt)
+                response_format: ResponseFormatJSONObject = {"type": "json_object"}
+                cache_key = None
+                cached = None
+                if settings.SIDEKICK_RESPONSE_CACHE:
+                    # Same key as call_openai_api, so both paths share entries
+                    cache_key = response_cache_key(
+                        settings.OPENAI_MODEL, sanitized_prompt, response_format
+                    )
+                    cached = await self._cached_llm_response(cache_key)
+                if cached:
+                    llm_response, token_usage = cached
+                    for event in LLMResponseStreamParser().feed(
+                        llm_response.model_dump_json()
+                    ):
+                        yield self._stream_event(event)
+                else:
+                    parser = LLMResponseStreamParser()
+                    usage = None
+                    estimated_tokens = estimate_prompt_tokens(sanitized_prompt)
+                    with timed_stage("llm"):
+                        async with self.llm_client.slot(
+                            estimated_tokens + settings.OPENAI_COMPLETION_TOKEN_RESERVE
+                        ) as reservation:
+                            stream = await self.client.chat.completions.create(
+                                model=settings.OPENAI_MODEL,
+                                messages=sanitized_prompt,
+                                response_format=response_format,
+                                stream=True,
+                                stream_options={"include_usage": True},
+                                timeout=settings.OPENAI_TIMEOUT,
+                            )
+                            async for chunk in stream:
+                                if chunk.usage:
+                                    usage = chunk.usage
+                                delta = (
+                                    chunk.choices[0].delta if chunk.choices else None
+                                )
+                                if not delta or not delta.content:
+                                    continue
+                                for event in parser.feed(delta.content):
+                                    yield self._stream_event(event)
+                            reservation.actual_tokens = _usage_total_tokens(usage)
+                    _log_prompt_estimate(estimated_tokens, usage)
+
+                    if not parser.text:
+                        raise ValueError("Empty response content from OpenAI")
+                    llm_response = self._parse_llm_response(parser.text)
+                    token_usage = TokenUsage(
+                        prompt_tokens=usage.prompt_tokens if usage else 0,
+                        completion_tokens=usage.completion_tokens if usage else 0,
+                        total_tokens=usage.total_tokens if usage else 0,
+                    )
+                    if cache_key and not llm_response.instructions.write:
+                        await store_response(
+                            cache_key, parser.text, token_usage.model_dump()
+                        )
 
-            # Get LLM response
-            processed_response, token_usage = await self._get_llm_response(
-                db, user_id, updated_history
+            output = await self._complete_turn(
+                db,
+                user_id,
+                thread,
+                updated_history,
+                self.process_data(llm_response),
+                token_usage,
             )
+            yield {"event": "done", "data": output.model_dump()}
+
+    def _stream_event(self, event: StreamEvent) -> Dict[str, Any]:
+        """Convert a parser event into a process_input_stream event"""
+        if event.kind == "followup":
+            return {"event": "followup", "data": {"delta": event.text}}
+        return {
+            "event": "entity",
+            "data": {"type": event.entity_type, "entity": event.entity},
+        }
+
+    def _resolve_engine(self, sidekick_input: SidekickInput) -> str:
+        """Pick the prompt engine for this request, falling back to the configured one"""
+        return sidekick_input.engine or settings.SIDEKICK_ENGINE
 
-            # Update conversation history
+    async def _complete_turn(
+        self,
+        db: AsyncSession,
+        user_id: str,
+        thread: SidekickThread,
+        updated_history: List[Dict[str, str]],
+        processed_response: Dict[str, Any],
+        token_usage: TokenUsage,
+    ) -> SidekickOutput:
+        """Persist history and entities for an answered turn and build the output"""
+        # Update conversation history
+        with timed_stage("history_write"):
             await self._update_conversation_history(
                 db, thread.id, updated_history, processed_response
             )
 
-            # Process entities
-            inflated_entities, context_updates = await self._process_entities(
-                db, user_id, processed_response
-            )
+        # Process entities
+        inflated_entities, context_updates = await self._process_entities(
+            db, user_id, processed_response
+        )
 
-            # Handle thread completion
+        # Handle thread completion
+        with timed_stage("thread_completion"):
             thread_info = await self._handle_thread_completion(
                 db, user_id, thread.id, processed_response
             )
 
-            return SidekickOutput(
-                response=processed_response["instructions"]["followup"],
-                thread_id=thread_info.new_thread_id or thread.id,
-                status=processed_response["instructions"]["status"],
-                new_prompt=processed_response["instructions"].get("new_prompt"),
-                is_thread_complete=thread_info.is_complete,
-                updated_entities=context_updates,
-                entities=inflated_entities,
-                token_usage=token_usage,
-            )
-
-        except HTTPException:
-            raise
-        except Exception as e:
-            logger.error(f"Error in process_input: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+        timer = current_turn_timer()
+        if timer is not None:
+            timer.prompt_tokens = token_usage.prompt_tokens
+            await record_turn_timings(user_id, thread.id, timer)
+
+        return SidekickOutput(
+            response=processed_response["instructions"]["followup"],
+            thread_id=thread_info.new_thread_id or thread.id,
+            status=processed_response["instructions"]["status"],
+            new_prompt=processed_response["instructions"].get("new_prompt"),
+            is_thread_complete=thread_info.is_complete,
+            updated_entities=context_updates,
+            entities=inflated_entities,
+            token_usage=token_usage,
+        )
 
     async def _handle_conversation_thread(
         self, db: AsyncSession, user_id: str, sidekick_input: SidekickInput
     ) -> Tuple[SidekickThread, List[Dict[str, str]]]:
         """Handle thread creation/retrieval and history update"""
-        try:
+        with timed_stage("thread_fetch"):
             thread = await self.get_or_create_thread(
                 db, user_id, sidekick_input.thread_id
             )
-            updated_history = thread.conversation_history + [
-                {"role": "user", "content": sidekick_input.user_input}
-            ]
-            return thread, updated_history
-        except Exception as e:
-            logger.error(f"Error handling conversation thread: {str(e)}")
-            return thread, [{"role": "user", "content": sidekick_input.user_input}]
+            # Errors propagate: answering without the history would drop the
+            # earlier turns from this one and from every turn after it
+            history = await self._get_thread_history(db, thread)
+        return thread, history + [
+            {"role": "user", "content": sidekick_input.user_input}
+        ]
+
+    async def _get_thread_history(
+        self, db: AsyncSession, thread: SidekickThread
+    ) -> List[Dict[str, str]]:
+        """
+        The thread's summary message and its last SIDEKICK_HISTORY_WINDOW messages.
+        Messages that left the window since the last turn are folded into the
+        stored summary first, so each is summarized once.
+        """
+        window = await get_sidekick_messages(
+            db, thread.id, settings.SIDEKICK_HISTORY_WINDOW
+        )
+        if window and thread.summary_seq < window[0].seq:
+            dropped = await get_sidekick_messages_between(
+                db, thread.id, thread.summary_seq, window[0].seq
+            )
+            summary = fold_into_summary(
+                thread.history_summary,
+                [
+                    {"role": message.role, "content": message.content}
+                    for message in dropped
+                ],
+            )
+            await update_thread_summary(db, thread, summary, window[0].seq)
+
+        history = [
+            {"role": message.role, "content": message.content} for message in window
+        ]
+        if thread.history_summary:
+            history.insert(0, summary_message(thread.history_summary))
+        return history
 
     async def _get_llm_response(
-        self, db: AsyncSession, user_id: str, conversation_history: List[Dict[str, str]]
+        self,
+        db: AsyncSession,
+        user_id: str,
+        conversation_history: List[Dict[str, str]],
+        engine: str = "legacy",
     ) -> Tuple[Dict[str, Any], TokenUsage]:
         """Get and process LLM response"""
+        if engine == "v2":
+            with timed_stage("llm"):
+                llm_response, token_usage = await self.call_openai_api_with_tools(
+                    db, user_id, self.construct_prompt_v2(conversation_history)
+                )
+        else:
+            prompt = await self._build_prompt(db, user_id, conversation_history)
+            with timed_stage("llm"):
+                llm_response, token_usage = await self.call_openai_api(prompt)
+        return self.process_data(llm_response), token_usage
+
+    async def _build_prompt(
+        self, db: AsyncSession, user_id: str, conversation_history: List[Dict[str, str]]
+    ) -> List[Dict[str, str]]:
+        """Construct the prompt, falling back to a minimal one on failure"""
         try:
-            prompt = await self.construct_prompt(db, user_id, conversation_history)
+            return await self.construct_prompt(db, user_id, conversation_history)
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error constructing prompt: {str(e)}")
-            prompt = [
+            return [
                 {"role": "system", "content": settings.SIDEKICK_SYSTEM_PROMPT},
                 {"role": "user", "content": conversation_history[-1]["content"]},
             ]
 
-        llm_response, token_usage = await self.call_openai_api(prompt)
-        return self.process_data(llm_response), token_usage
-
     async def _update_conversation_history(
         self,
         db: AsyncSession,
@@ -235,12 +573,26 @@ class SidekickService:
         current_history: List[Dict[str, str]],
         processed_response: Dict[str, Any],
     ) -> None:
-        """Update thread conversation history"""
+        """Append this turn's user and assistant messages to the thread"""
         try:
-            final_history = current_history + [
-                {"role": "assistant", "content": json.dumps(processed_response)}
+            turn = [
+                current_history[-1],
+                {"role": "assistant", "content": json.dumps(processed_response)},
             ]
-            await update_sidekick_thread(db, thread_id, final_history)
+            new_messages: List[Dict[str, Any]] = [
+                {**message, "token_count": count_text_tokens(message["content"])}
+                for message in turn
+            ]
+            if settings.SIDEKICK_DEFER_WRITES:
+                # Persisted after the response; the next read of the thread drains it
+                await get_background_task_queue().enqueue(
+                    PERSIST_HISTORY_TASK,
+                    {"thread_id": thread_id, "messages": new_messages},
+                    group_key=thread_group(thread_id),
+                    db=db,
+                )
+                return
+            await append_sidekick_messages(db, thread_id, new_messages)
         except Exception as e:
             logger.error(f"Error updating thread history: {str(e)}")
 
@@ -253,25 +605,27 @@ class SidekickService:
                 f"Starting _process_entities with processed_response: {processed_response}"
             )
 
-            context_updates, entity_updates = await self.update_entities(
-                db, processed_response["data"], user_id
-            )
+            with timed_stage("entity_upsert"):
+                context_updates, entity_updates = await self.update_entities(
+                    db, processed_response["data"], user_id
+                )
             logger.info(f"After update_entities - entity_updates: {entity_updates}")
 
             affected_entities = processed_response["instructions"]["affected_entities"]
             logger.info(f"Processing affected_entities: {affected_entities}")
 
-            fetched_entities = await self.fetch_entities_by_ids(
-                db, affected_entities, user_id
-            )
-            logger.info(
-                f"After fetch_entities_by_ids - fetched_entities: {fetched_entities}"
-            )
-            logger.info(f"Fetched people: {fetched_entities.get('people', [])}")
+            with timed_stage("merge"):
+                fetched_entities = await self.fetch_entities_by_ids(
+                    db, affected_entities, user_id
+                )
+                logger.info(
+                    f"After fetch_entities_by_ids - fetched_entities: {fetched_entities}"
+                )
+                logger.info(f"Fetched people: {fetched_entities.get('people', [])}")
 
-            inflated_entities = await self._merge_entities(
-                entity_updates, fetched_entities
-            )
+                inflated_entities = await self._merge_entities(
+                    entity_updates, fetched_entities
+                )
             logger.info(
                 f"After _merge_entities - inflated_entities: {inflated_entities}"
             )
@@ -357,10 +711,19 @@ class SidekickService:
 
         if is_complete:
             try:
-                new_thread = await create_sidekick_thread(
-                    db, SidekickThreadCreate(user_id=user_id)
-                )
-                new_thread_id = new_thread.id
+                if settings.SIDEKICK_DEFER_WRITES:
+                    new_thread_id = str(uuid.uuid4())
+                    await get_background_task_queue().enqueue(
+                        CREATE_THREAD_TASK,
+                        {"thread_id": new_thread_id, "user_id": user_id},
+                        group_key=thread_group(new_thread_id),
+                        db=db,
+                    )
+                else:
+                    new_thread = await create_sidekick_thread(
+                        db, SidekickThreadCreate(user_id=user_id)
+                    )
+                    new_thread_id = new_thread.id
             except Exception as e:
                 logger.error(f"Error creating new thread: {str(e)}")
                 is_complete = False
@@ -371,9 +734,23 @@ class SidekickService:
         )
 
     async def get_user_context(
-        self, db: AsyncSession, user_id: str
+        self, db: AsyncSession, user_id: str, version: Optional[int] = None
     ) -> Dict[str, List[Dict[str, Any]]]:
-        """Get user context with improved error handling"""
+        """
+        Get user context, served from the versioned Redis snapshot when current.
+        version is the user's entity version if the caller has already read it.
+        """
+        # Read the version before querying so a concurrent write can only make
+        # the stored snapshot look older than it is, never newer
+        if version is None:
+            version = await get_entity_version(user_id)
+        cache_key = None
+        if version is not None:
+            cache_key = CONTEXT_SNAPSHOT_KEY.format(user_id=user_id, version=version)
+            cached = await cache_get_json(cache_key)
+            if isinstance(cached, dict):
+                return cached
+
         context: Dict[str, List[Dict[str, Any]]] = {
             "people": [],
             "tasks": [],
@@ -416,6 +793,10 @@ class SidekickService:
             "notes", get_notes_for_user, self.note_to_dict
         )
 
+        if cache_key is not None:
+            await cache_set_json(
+                cache_key, context, settings.SIDEKICK_CONTEXT_CACHE_TTL
+            )
         return context
 
     async def update_or_create_entity(
@@ -477,13 +858,36 @@ class SidekickService:
 
         return None
 
-    async def update_or_create_person(
-        self, db: AsyncSession, person_data: Dict[str, Any], user_id: str
-    ) -> Optional[Dict[str, Any]]:
+    def _normalize_person_data(self, person_data: Dict[str, Any]) -> None:
         # Set default importance if missing or empty
         if not person_data.get("importance", "").strip():
             person_data["importance"] = "medium"
 
+    def _normalize_note_data(self, note_data: Dict[str, Any]) -> None:
+        # Ensure dates are in the correct format
+        try:
+            for date_field in ["created_at", "updated_at"]:
+                if date_field in note_data:
+                    # Convert to datetime if it's a string
+                    if isinstance(note_data[date_field], str):
+                        try:
+                            datetime.fromisoformat(
+                                note_data[date_field].replace("Z", "+00:00")
+                            )
+                        except ValueError:
+                            # If parsing fails, use current UTC time
+                            note_data[date_field] = datetime.now(UTC).isoformat()
+        except Exception as e:
+            logger.error(f"Error processing note dates: {str(e)}")
+            # Set current time for both fields if there's an error
+            current_time = datetime.now(UTC).isoformat()
+            note_data["created_at"] = current_time
+            note_data["updated_at"] = current_time
+
+    async def update_or_create_person(
+        self, db: AsyncSession, person_data: Dict[str, Any], user_id: str
+    ) -> Optional[Dict[str, Any]]:
+        self._normalize_person_data(person_data)
         return await self.update_or_create_entity(
             db,
             person_data,
@@ -529,26 +933,7 @@ class SidekickService:
     async def update_or_create_note(
         self, db: AsyncSession, note_data: Dict[str, Any], user_id: str
     ) -> Optional[Dict[str, Any]]:
-        # Ensure dates are in the correct format
-        try:
-            for date_field in ["created_at", "updated_at"]:
-                if date_field in note_data:
-                    # Convert to datetime if it's a string
-                    if isinstance(note_data[date_field], str):
-                        try:
-                            datetime.fromisoformat(
-                                note_data[date_field].replace("Z", "+00:00")
-                            )
-                        except ValueError:
-                            # If parsing fails, use current UTC time
-                            note_data[date_field] = datetime.now(UTC).isoformat()
-        except Exception as e:
-            logger.error(f"Error processing note dates: {str(e)}")
-            # Set current time for both fields if there's an error
-            current_time = datetime.now(UTC).isoformat()
-            note_data["created_at"] = current_time
-            note_data["updated_at"] = current_time
-
+        self._normalize_note_data(note_data)
         return await self.update_or_create_entity(
             db,
             note_data,
@@ -660,45 +1045,36 @@ class SidekickService:
         self, messages: List[Dict[str, str]], max_retries: int = 3
     ) -> tuple[LLMResponse, TokenUsage]:
         """Call OpenAI API with retry logic and improved error handling"""
+        response_format: ResponseFormatJSONObject = {"type": "json_object"}
+        cache_key = None
+        if settings.SIDEKICK_RESPONSE_CACHE:
+            cache_key = response_cache_key(
+                settings.OPENAI_MODEL,
+                self._sanitize_messages(messages),
+                response_format,
+            )
+            if cached := await self._cached_llm_response(cache_key):
+                return cached
+
         last_error = None
         for attempt in range(max_retries):
             try:
-                # Sanitize messages
-                sanitized_messages = []
-                for msg in messages:
-                    try:
-                        if isinstance(msg["content"], str):
-                            content = (
-                                msg["content"]
-                                .encode("utf-8", errors="replace")
-                                .decode("utf-8")
-                            )
-                        else:
-                            content = (
-                                str(msg["content"])
-                                .encode("utf-8", errors="replace")
-                                .decode("utf-8")
-                            )
-                        sanitized_messages.append(
-                            {"role": msg["role"], "content": content}
-                        )
-                    except Exception as e:
-                        logger.error(f"Error sanitizing message: {str(e)}")
-                        content = "Error processing message content"
-                        sanitized_messages.append(
-                            {"role": msg.get("role", "user"), "content": content}
-                        )
-
-                # Make API call using the synchronous create method but in an async context
-                response = await asyncio.get_event_loop().run_in_executor(
-                    None,
-                    lambda: self.client.chat.completions.create(
+                sanitized_messages = self._sanitize_messages(messages)
+                estimated_tokens = estimate_prompt_tokens(sanitized_messages)
+
+                # Make API call on the shared async client, within the rate budget
+                # and bounded by its concurrency cap
+                async with self.llm_client.slot(
+                    estimated_tokens + settings.OPENAI_COMPLETION_TOKEN_RESERVE
+                ) as reservation:
+                    response = await self.client.chat.completions.create(
                         model=settings.OPENAI_MODEL,
                         messages=sanitized_messages,
-                        response_format={"type": "json_object"},
-                        timeout=30.0,
-                    ),
-                )
+                        response_format=response_format,
+                        timeout=settings.OPENAI_TIMEOUT,
+                    )
+                    reservation.actual_tokens = _usage_total_tokens(response.usage)
+                _log_prompt_estimate(estimated_tokens, response.usage)
 
                 # Process response
                 if not response.choices:
@@ -708,31 +1084,31 @@ class SidekickService:
                 if not raw_response:
                     raise ValueError("Empty response content from OpenAI")
 
-                logger.debug(f"Raw OpenAI API response: {raw_response}")
-
-                try:
-                    api_response = LLMResponse.model_validate_json(raw_response)
-                except json.JSONDecodeError as e:
-                    logger.error(f"JSON decode error: {str(e)}")
-                    logger.error(f"Raw response that caused the error: {raw_response}")
-                    # Attempt to sanitize and retry JSON parsing
-                    try:
-                        sanitized_response = json.loads(raw_response)
-                        api_response = LLMResponse.model_validate(sanitized_response)
-                    except Exception as e2:
-                        logger.error(f"Failed to sanitize response: {str(e2)}")
-                        raise HTTPException(
-                            status_code=500,
-                            detail="Unable to parse OpenAI response as JSON",
-                        )
+                api_response = self._parse_llm_response(raw_response)
 
+                usage = response.usage
                 token_usage = TokenUsage(
-                    prompt_tokens=response.usage.prompt_tokens,
-                    completion_tokens=response.usage.completion_tokens,
-                    total_tokens=response.usage.total_tokens,
+                    prompt_tokens=usage.prompt_tokens if usage else 0,
+                    completion_tokens=usage.completion_tokens if usage else 0,
+                    total_tokens=usage.total_tokens if usage else 0,
                 )
+                # Never cache a response that writes, so mutations are not replayed
+                if cache_key and not api_response.instructions.write:
+                    await store_response(
+                        cache_key, raw_response, token_usage.model_dump()
+                    )
                 return api_response, token_usage
 
+            except GovernorTimeoutError as e:
+                # Already waited for rate budget; retrying would only queue again
+                logger.error(f"OpenAI rate budget exhausted: {str(e)}")
+                raise HTTPException(status_code=503, detail=str(e))
+            except BadRequestError as e:
+                # e.g. context_length_exceeded; the same payload would fail again
+                logger.error(f"OpenAI rejected the request: {str(e)}")
+                raise HTTPException(
+                    status_code=500, detail=f"OpenAI API call rejected: {e.message}"
+                )
             except Exception as e:
                 last_error = e
                 logger.error(
@@ -749,10 +1125,276 @@ class SidekickService:
             detail=f"OpenAI API call failed after {max_retries} attempts: {str(last_error)}",
         )
 
+    async def _cached_llm_response(
+        self, cache_key: str
+    ) -> Optional[Tuple[LLMResponse, TokenUsage]]:
+        """Return a cached read-only response; a hit costs no tokens"""
+        cached = await get_cached_response(cache_key)
+        if cached is None:
+            return None
+        raw_response, _ = cached
+        try:
+            api_response = self._parse_llm_response(raw_response)
+        except Exception as e:
+            logger.warning(f"Discarding unreadable cached LLM response: {str(e)}")
+            return None
+        if api_response.instructions.write:
+            return None
+        logger.info("Serving LLM response from cache")
+        return api_response, TokenUsage(
+            prompt_tokens=0, completion_tokens=0, total_tokens=0
+        )
+
+    async def call_openai_api_with_tools(
+        self,
+        db: AsyncSession,
+        user_id: str,
+        messages: List[Dict[str, str]],
+        max_iterations: Optional[int] = None,
+    ) -> tuple[LLMResponse, TokenUsage]:
+        """
+        Run the v2 function-calling loop.
+
+        The model may call the functions in FUNCTION_DEFINITIONS to fetch entities on
+        demand; each call is executed and its result appended to the loop history.
+        The last iteration disables tools so the loop always ends with an answer.
+        Older history is trimmed to SIDEKICK_PROMPT_TOKEN_BUDGET before each call.
+
+        The response cache is not consulted: answers depend on tool results read
+        from live data, which the prompt alone does not identify.
+        """
+        max_iterations = max_iterations or settings.SIDEKICK_MAX_TOOL_ITERATIONS
+        loop_messages = self._sanitize_messages(messages)
+        tools: List[ChatCompletionToolParam] = [
+            {"type": "function", "function": cast(FunctionDefinition, definition)}
+            for definition in FUNCTION_DEFINITIONS
+        ]
+        usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+
+        for iteration in range(max_iterations):
+            is_last = iteration == max_iterations - 1
+            loop_messages = trim_history_to_budget(loop_messages)
+            try:
+                async with self.llm_client.slot(
+                    estimate_request_tokens(loop_messages)
+                ) as reservation:
+                    response = await self.client.chat.completions.create(
+                        model=settings.OPENAI_MODEL,
+                        messages=loop_messages,
+                        tools=tools,
+                        tool_choice="none" if is_last else "auto",
+                        response_format={"type": "json_object"},
+                        timeout=settings.OPENAI_TIMEOUT,
+                    )
+                    reservation.actual_tokens = _usage_total_tokens(response.usage)
+            except GovernorTimeoutError as e:
+                logger.error(f"OpenAI rate budget exhausted: {str(e)}")
+                raise HTTPException(status_code=503, detail=str(e))
+            except Exception as e:
+                logger.error(
+                    f"Error in OpenAI API call (tool iteration {iteration}): {e}"
+                )
+                raise HTTPException(
+                    status_code=500, detail=f"OpenAI API call failed: {str(e)}"
+                )
+
+            if response.usage:
+                usage["prompt_tokens"] += response.usage.prompt_tokens
+                usage["completion_tokens"] += response.usage.completion_tokens
+                usage["total_tokens"] += response.usage.total_tokens
+
+            if not response.choices:
+                raise HTTPException(
+                    status_code=500, detail="No choices in OpenAI response"
+                )
+            message = response.choices[0].message
+
+            if message.tool_calls:
+                loop_messages.append(
+                    {
+                        "role": "assistant",
+                        "content": message.content,
+                        "tool_calls": [
+                            {
+                                "id": call.id,
+                                "type": "function",
+                                "function": {
+                                    "name": call.function.name,
+                                    "arguments": call.function.arguments,
+                                },
+                            }
+                            for call in message.tool_calls
+                        ],
+                    }
+                )
+                for call in message.tool_calls:
+                    result = await self._execute_function_call(
+                        db, user_id, call.function.name, call.function.arguments
+                    )
+                    loop_messages.append(
+                        {
+                            "role": "tool",
+                            "tool_call_id": call.id,
+                            "content": json.dumps(result, default=str),
+                        }
+                    )
+                continue
+
+            if not message.content:
+                raise HTTPException(
+                    status_code=500, detail="Empty response content from OpenAI"
+                )
+            return self._parse_llm_response(message.content), TokenUsage(**usage)
+
+        raise HTTPException(
+            status_code=500,
+            detail=f"No answer from OpenAI after {max_iterations} tool iterations",
+        )
+
+    async def _execute_function_call(
+        self, db: AsyncSession, user_id: str, name: str, arguments: Optional[str]
+    ) -> Dict[str, Any]:
+        """Run a model-requested function against the user's data"""
+        handler_class = FUNCTION_HANDLERS.get(name)
+        if not handler_class:
+            logger.warning(f"Model requested unknown function: {name}")
+            return {"error": f"Unknown function: {name}"}
+
+        try:
+            params = json.loads(arguments or "{}")
+            # The row limit keeps tool results from dominating the prompt
+            handler = handler_class(db, user_id, settings.SIDEKICK_TOOL_RESULT_LIMIT)
+            return await handler.handle(params)
+        except Exception as e:
+            logger.error(f"Error executing function {name}: {str(e)}")
+            return {"error": str(e)}
+
+    def _sanitize_messages(
+        self, messages: List[Dict[str, str]]
+    ) -> List[ChatCompletionMessageParam]:
+        """Ensure every message has a role and valid UTF-8 string content"""
+        sanitized_messages: List[ChatCompletionMessageParam] = []
+        for msg in messages:
+            try:
+                if isinstance(msg["content"], str):
+                    content = (
+                        msg["content"].encode("utf-8", errors="replace").decode("utf-8")
+                    )
+                else:
+                    content = (
+                        str(msg["content"])
+                        .encode("utf-8", errors="replace")
+                        .decode("utf-8")
+                    )
+                sanitized_messages.append(
+                    cast(
+                        ChatCompletionMessageParam,
+                        {"role": msg["role"], "content": content},
+                    )
+                )
+            except Exception as e:
+                logger.error(f"Error sanitizing message: {str(e)}")
+                content = "Error processing message content"
+                sanitized_messages.append(
+                    cast(
+                        ChatCompletionMessageParam,
+                        {"role": msg.get("role", "user"), "content": content},
+                    )
+                )
+        return sanitized_messages
+
+    def _parse_llm_response(self, raw_response: str) -> LLMResponse:
+        """Validate raw completion text as an LLMResponse"""
+        logger.debug(f"Raw OpenAI API response: {raw_response}")
+
+        try:
+            return LLMResponse.model_validate_json(raw_response)
+        except json.JSONDecodeError as e:
+            logger.error(f"JSON decode error: {str(e)}")
+            logger.error(f"Raw response that caused the error: {raw_response}")
+            # Attempt to sanitize and retry JSON parsing
+            try:
+                sanitized_response = json.loads(raw_response)
+                return LLMResponse.model_validate(sanitized_response)
+            except Exception as e2:
+                logger.error(f"Failed to sanitize response: {str(e2)}")
+                raise HTTPException(
+                    status_code=500,
+                    detail="Unable to parse OpenAI response as JSON",
+                )
+
     async def update_entities(
         self, db: AsyncSession, data: Dict[str, List[Dict[str, Any]]], user_id: str
     ) -> Tuple[Dict[str, int], Dict[str, List[Dict[str, Any]]]]:
-        """Update entities with improved error handling"""
+        """Validate all entities, then write them with one bulk upsert and commit"""
+        context_updates = {"tasks": 0, "people": 0, "topics": 0, "notes": 0}
+        updated_entities: Dict[str, List[Dict[str, Any]]] = {
+            "tasks": [],
+            "people": [],
+            "topics": [],
+            "notes": [],
+        }
+
+        rows_by_type: Dict[str, List[Dict[str, Any]]] = {}
+        for entity_type, entities in data.items():
+            if not isinstance(entities, list):
+                logger.error(
+                    f"Invalid data format for {entity_type}: expected list, got {type(entities)}"
+                )
+                continue
+            if entity_type not in ENTITY_WRITE_CONFIG:
+                logger.warning(f"Unknown entity type: {entity_type}")
+                continue
+
+            for entity in entities:
+                if not isinstance(entity, dict):
+                    logger.error(
+                        f"Invalid entity format for {entity_type}: expected dict, got {type(entity)}"
+                    )
+                    continue
+                if (row := self._prepare_entity_row(entity_type, entity)) is not None:
+                    rows_by_type.setdefault(entity_type, []).append(row)
+
+        try:
+            saved = await bulk_upsert_entities(db, user_id, rows_by_type)
+        except SQLAlchemyError as e:
+            logger.error(f"Bulk entity upsert failed, writing one by one: {str(e)}")
+            await db.rollback()
+            return await self._update_entities_individually(db, data, user_id)
+
+        for entity_type, models in saved.items():
+            _, convert_name = ENTITY_WRITE_CONFIG[entity_type]
+            convert_func = getattr(self, convert_name)
+            for model in models:
+                try:
+                    updated_entities[entity_type].append(convert_func(model))
+                    context_updates[entity_type] += 1
+                except Exception as e:
+                    logger.error(f"Error converting {entity_type}: {str(e)}")
+
+        return context_updates, updated_entities
+
+    def _prepare_entity_row(
+        self, entity_type: str, entity_data: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """Normalize and validate one LLM entity into a column dict for upserting"""
+        create_schema, _ = ENTITY_WRITE_CONFIG[entity_type]
+        try:
+            if entity_type == "people":
+                self._normalize_person_data(entity_data)
+            elif entity_type == "notes":
+                self._normalize_note_data(entity_data)
+            return cast(Dict[str, Any], create_schema(**entity_data).model_dump())
+        except ValidationError as e:
+            logger.error(f"Validation error for {entity_type}: {str(e)}")
+        except Exception as e:
+            logger.error(f"Unexpected error processing {entity_type}: {str(e)}")
+        return None
+
+    async def _update_entities_individually(
+        self, db: AsyncSession, data: Dict[str, List[Dict[str, Any]]], user_id: str
+    ) -> Tuple[Dict[str, int], Dict[str, List[Dict[str, Any]]]]:
+        """Per-entity update path, used when the bulk upsert fails"""
         context_updates = {"tasks": 0, "people": 0, "topics": 0, "notes": 0}
         updated_entities: Dict[str, List[Dict[str, Any]]] = {
             "tasks": [],
@@ -855,6 +1497,7 @@ class SidekickService:
         """Get existing thread or create new one with error handling"""
         try:
             if thread_id:
+                await drain_thread_tasks(thread_id)
                 thread = await get_sidekick_thread(db, thread_id)
                 if not thread or thread.user_id != user_id:
                     logger.error(
@@ -888,39 +1531,32 @@ class SidekickService:
     ) -> List[Dict[str, str]]:
         """Construct prompt with user context and error handling"""
         try:
-            # Get user context with all entities
-            context = await self.get_user_context(db, user_id)
-
-            # Sanitize context before adding to prompt
-            sanitized_context = json.dumps(context, ensure_ascii=False, default=str)
-
-            # Construct messages array
-            messages = [
-                {"role": "system", "content": settings.SIDEKICK_SYSTEM_PROMPT},
-                {"role": "user", "content": f"Current context: {sanitized_context}"},
-            ]
-
-            # Add conversation history with validation
-            for msg in conversation_history:
-                try:
-                    # Ensure message has required fields
-                    if "role" not in msg or "content" not in msg:
-                        logger.warning(f"Skipping invalid message in history: {msg}")
-                        continue
-
-                    # Sanitize message content
-                    content = msg["content"]
-                    if not isinstance(content, str):
-                        content = str(content)
-
-                    # Add sanitized message
-                    messages.append({"role": msg["role"], "content": content})
-                except Exception as e:
-                    logger.error(f"Error processing conversation message: {str(e)}")
-                    continue
+            # Get user context, keeping only the entities relevant to this turn
+            with timed_stage("context_build"):
+                version = await get_entity_version(user_id)
+                context = await self.get_user_context(db, user_id, version=version)
+                if settings.SIDEKICK_CONTEXT_SELECTION:
+                    # The BM25 index is cached under the snapshot's key
+                    snapshot_key = (
+                        CONTEXT_SNAPSHOT_KEY.format(user_id=user_id, version=version)
+                        if version is not None
+                        else None
+                    )
+                    context = select_relevant_context(
+                        context, conversation_history, cache_key=snapshot_key
+                    )
 
-            return messages
+            with timed_stage("prompt_serialization"):
+                # System prompt, serialized context and validated history, trimmed
+                # to the prompt token budget before anything is sent
+                return fit_prompt_to_budget(
+                    [{"role": "system", "content": settings.SIDEKICK_SYSTEM_PROMPT}],
+                    context,
+                    self._history_messages(conversation_history),
+                )
 
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error constructing prompt: {str(e)}")
             # Return minimal prompt if context gathering fails
@@ -931,3 +1567,36 @@ class SidekickService:
                     "content": "Error retrieving context. Please proceed with minimal context.",
                 },
             ] + conversation_history  # Still include the conversation history
+
+    def construct_prompt_v2(
+        self, conversation_history: List[Dict[str, str]]
+    ) -> List[Dict[str, str]]:
+        """Construct a v2 prompt: no context dump, entities are fetched via functions"""
+        return [
+            {"role": "system", "content": settings.SIDEKICK_SYSTEM_PROMPT},
+            {"role": "system", "content": V2_CONTEXT_INSTRUCTIONS},
+        ] + self._history_messages(conversation_history)
+
+    def _history_messages(
+        self, conversation_history: List[Dict[str, str]]
+    ) -> List[Dict[str, str]]:
+        """Compact and validate conversation history for inclusion in a prompt"""
+        messages = []
+        for msg in compact_history(conversation_history):
+            try:
+                # Ensure message has required fields
+                if "role" not in msg or "content" not in msg:
+                    logger.warning(f"Skipping invalid message in history: {msg}")
+                    continue
+
+                # Sanitize message content
+                content = msg["content"]
+                if not isinstance(content, str):
+                    content = str(content)
+
+                # Add sanitized message
+                messages.append({"role": msg["role"], "content": content})
+            except Exception as e:
+                logger.error(f"Error processing conversation message: {str(e)}")
+                continue
+        return messages
@@ -0,0 +1,176 @@
+"""
+Incremental parser for streamed Sidekick LLM responses.
+
+The model streams a single JSON object shaped like LLMResponse. This parser is
+fed the raw text chunks as they arrive and reports:
+- the decoded characters of instructions.followup as soon as they are received
+- each data.<type>[i] entity as soon as its closing brace is seen
+The full text is kept so the caller can validate the final LLMResponse.
+"""
+
+import json
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Tuple, Union
+
+FOLLOWUP_PATH = ("instructions", "followup")
+ENTITY_TYPES = ("tasks", "people", "topics", "notes")
+
+_SIMPLE_ESCAPES = {
+    '"': '"',
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+@dataclass
+class StreamEvent:
+    """A parser event: a followup text delta or a completed data entity"""
+
+    kind: str  # "followup" or "entity"
+    text: str = ""
+    entity_type: Optional[str] = None
+    entity: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class _Frame:
+    kind: str  # "object" or "array"
+    key: Optional[str] = None
+    index: int = 0
+    expect_key: bool = True
+    start: Optional[int] = None  # buffer offset, set for captured entity objects
+
+
+class LLMResponseStreamParser:
+    """Character-level JSON state machine that tracks the current value path"""
+
+    def __init__(self) -> None:
+        self._buffer: List[str] = []
+        self._offset = 0
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._string_is_key = False
+        self._string_path: Tuple[Union[str, int], ...] = ()
+        self._string_chars: List[str] = []
+        self._escape: Optional[str] = None
+        self._pending_surrogate: Optional[str] = None
+
+    @property
+    def text(self) -> str:
+        """All text fed so far"""
+        return "".join(self._buffer)
+
+    def feed(self, chunk: str) -> List[StreamEvent]:
+        """Consume a chunk of streamed text and return the events it completed"""
+        events: List[StreamEvent] = []
+        self._buffer.append(chunk)
+        for char in chunk:
+            self._consume(char, events)
+            self._offset += 1
+        return events
+
+    def _path(self) -> Tuple[Union[str, int], ...]:
+        path: List[Union[str, int]] = []
+        for frame in self._stack:
+            if frame.kind == "object":
+                path.append(frame.key or "")
+            else:
+                path.append(frame.index)
+        return tuple(path)
+
+    def _consume(self, char: str, events: List[StreamEvent]) -> None:
+        if self._in_string:
+            self._consume_string_char(char, events)
+            return
+
+        top = self._stack[-1] if self._stack else None
+        if char == '"':
+            self._in_string = True
+            self._string_chars = []
+            self._string_is_key = bool(top and top.kind == "object" and top.expect_key)
+            self._string_path = self._path()
+        elif char in "{[":
+            frame = _Frame(kind="object" if char == "{" else "array")
+            path = self._path()
+            if (
+                char == "{"
+                and len(path) == 3
+                and path[0] == "data"
+                and path[1] in ENTITY_TYPES
+            ):
+                frame.start = self._offset
+            self._stack.append(frame)
+        elif char in "}]":
+            if not self._stack:
+                return
+            frame = self._stack.pop()
+            if frame.start is not None and self._stack:
+                entity_type = self._stack[-2].key if len(self._stack) > 1 else None
+                raw = "".join(self._buffer)[frame.start : self._offset + 1]
+                try:
+                    entity = json.loads(raw)
+                except json.JSONDecodeError:
+                    entity = None
+                if isinstance(entity, dict) and entity_type:
+                    events.append(
+                        StreamEvent(
+                            kind="entity", entity_type=entity_type, entity=entity
+                        )
+                    )
+        elif char == ":":
+            if top and top.kind == "object":
+                top.expect_key = False
+        elif char == ",":
+            if top and top.kind == "object":
+                top.expect_key = True
+            elif top and top.kind == "array":
+                top.index += 1
+
+    def _consume_string_char(self, char: str, events: List[StreamEvent]) -> None:
+        if self._escape is not None:
+            self._escape += char
+            if self._escape[0] == "u":
+                if len(self._escape) < 5:
+                    return
+                self._emit_unicode(self._escape[1:], events)
+            else:
+                self._emit_string_text(_SIMPLE_ESCAPES.get(char, char), events)
+            self._escape = None
+            return
+
+        if char == "\\":
+            self._escape = ""
+        elif char == '"':
+            self._in_string = False
+            if self._string_is_key and self._stack:
+                self._stack[-1].key = "".join(self._string_chars)
+        else:
+            self._emit_string_text(char, events)
+
+    def _emit_unicode(self, hex_digits: str, events: List[StreamEvent]) -> None:
+        try:
+            code_point = int(hex_digits, 16)
+        except ValueError:
+            return
+        if 0xD800 <= code_point <= 0xDBFF:
+            self._pending_surrogate = hex_digits
+            return
+        if self._pending_surrogate and 0xDC00 <= code_point <= 0xDFFF:
+            text = json.loads(f'"\\u{self._pending_surrogate}\\u{hex_digits}"')
+            self._pending_surrogate = None
+        else:
+            text = chr(code_point)
+        self._emit_string_text(text, events)
+
+    def _emit_string_text(self, text: str, events: List[StreamEvent]) -> None:
+        self._string_chars.append(text)
+        if not self._string_is_key and self._string_path == FOLLOWUP_PATH:
+            if events and events[-1].kind == "followup":
+                events[-1].text += text
+            else:
+                events.append(StreamEvent(kind="followup", text=text))
@@ -0,0 +1,140 @@
+"""
+Serialization and single-flight for Sidekick turns.
+
+A turn reads a thread's recent history, calls the model and appends its
+messages, so overlapping turns on one thread would each answer without seeing
+the other and interleave their messages. Turns are serialized per thread with
+an in-process asyncio lock and, when Redis is available, a Redis lock shared by
+all workers. The Redis lock is extended while the turn runs, so a long tool loop
+cannot outlive it; its TTL only bounds how long a dead worker keeps it.
+
+Byte-identical submissions (same user, thread, input and engine) that arrive
+while the first is still running in the same worker await its task instead of
+starting another turn. Finished results are never replayed: a duplicate sent
+afterwards, or to another worker, waits for the thread lock and runs its own
+turn.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Any, TypeVar
+from fastapi import HTTPException
+from redis.exceptions import LockError, RedisError
+from app.core.config import settings
+from utils.cache import get_redis_if_connected
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+LOCK_KEY = "sidekick:lock:{name}"
+
+_local_locks: Dict[str, asyncio.Lock] = {}
+_local_lock_users: Counter = Counter()
+_inflight: Dict[str, "asyncio.Future[Any]"] = {}
+
+
+def submission_key(
+    user_id: str, thread_id: Optional[str], user_input: str, engine: str
+) -> str:
+    """Digest identifying a byte-identical submission"""
+    payload = json.dumps(
+        [user_id, thread_id or "", user_input, engine], ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _busy() -> HTTPException:
+    return HTTPException(
+        status_code=409,
+        detail="Another request for this thread is still being processed",
+    )
+
+
+async def _keep_alive(lock: Any, name: str, ttl: float) -> None:
+    """Reset the lock's TTL every third of it for as long as it is held"""
+    while True:
+        await asyncio.sleep(ttl / 3)
+        try:
+            await lock.reacquire()
+        except (LockError, RedisError) as e:
+            logger.warning(f"Failed to extend Redis lock for {name}: {str(e)}")
+            return
+
+
+@asynccontextmanager
+async def _redis_lock(name: str, wait: float, ttl: float) -> AsyncIterator[None]:
+    client = get_redis_if_connected()
+    if client is None:
+        yield
+        return
+
+    lock = client.lock(LOCK_KEY.format(name=name), timeout=ttl, blocking_timeout=wait)
+    try:
+        acquired = await lock.acquire()
+    except RedisError as e:
+        # Fall back to the in-process lock only rather than failing the turn
+        logger.warning(f"Redis lock unavailable for {name}: {str(e)}")
+        yield
+        return
+    if not acquired:
+        raise _busy()
+    keeper = asyncio.create_task(_keep_alive(lock, name, ttl))
+    try:
+        yield
+    finally:
+        keeper.cancel()
+        try:
+            await lock.release()
+        except (LockError, RedisError) as e:
+            logger.warning(f"Failed to release Redis lock for {name}: {str(e)}")
+
+
+@asynccontextmanager
+async def thread_lock(
+    name: str,
+    wait: float = settings.SIDEKICK_THREAD_LOCK_WAIT,
+    ttl: float = settings.SIDEKICK_THREAD_LOCK_TTL,
+) -> AsyncIterator[None]:
+    """
+    Hold the lock for one thread (or one new-thread submission).
+
+    Raises a 409 HTTPException if the lock is not acquired within wait seconds.
+    The Redis lock is extended while held and expires ttl seconds after a worker
+    dies holding it.
+    """
+    local = _local_locks.setdefault(name, asyncio.Lock())
+    _local_lock_users[name] += 1
+    try:
+        try:
+            await asyncio.wait_for(local.acquire(), wait)
+        except asyncio.TimeoutError:
+            raise _busy()
+        try:
+            async with _redis_lock(name, wait, ttl):
+                yield
+        finally:
+            local.release()
+    finally:
+        _local_lock_users[name] -= 1
+        if not _local_lock_users[name]:
+            del _local_lock_users[name]
+            _local_locks.pop(name, None)
+
+
+async def single_flight(key: str, run: Callable[[], Awaitable[T]]) -> T:
+    """Run run() once per key at a time; concurrent callers share its result"""
+    pending = _inflight.get(key)
+    if pending is not None:
+        logger.info(f"Coalescing duplicate submission {key[:12]}")
+        return await asyncio.shield(pending)
+
+    task = asyncio.ensure_future(run())
+    _inflight[key] = task
+    task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # Shielded so a leader that disconnects does not cancel its followers' turn
+    return await asyncio.shield(task)
@@ -0,0 +1,160 @@
+"""
+Per-stage latency breakdown for Sidekick turns.
+
+A TurnTimer is bound to the running turn through a context variable, so the
+stages of process_input (thread fetch, context build, prompt serialization, LLM
+call, history write, entity upsert, merge, thread completion) can be timed where
+they happen without passing the timer around. The router returns the breakdown
+in a Server-Timing header.
+
+Finished turns are appended to capped Redis lists per user and per thread, with
+the prompt token count stored next to the timings; p50/p95 are computed from
+those samples on read. Without Redis nothing is persisted.
+"""
+
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Iterator, List, Optional
+from redis.exceptions import RedisError
+from app.core.config import settings
+from utils.cache import get_redis_if_connected
+
+logger = logging.getLogger(__name__)
+
+TIMINGS_KEY = "sidekick:timings:{scope}:{scope_id}"
+
+_current_timer: ContextVar[Optional["TurnTimer"]] = ContextVar(
+    "sidekick_turn_timer", default=None
+)
+
+
+class TurnTimer:
+    """Accumulates milliseconds per stage for one turn"""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.prompt_tokens: Optional[int] = None
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self) -> str:
+        """Server-Timing header value, e.g. "llm;dur=812.4, total;dur=845.0" """
+        metrics = []
+        for name, duration in self.stages.items():
+            metric = f"{name};dur={duration:.1f}"
+            if name == "llm" and self.prompt_tokens is not None:
+                metric += f';desc="prompt_tokens={self.prompt_tokens}"'
+            metrics.append(metric)
+        metrics.append(f"total;dur={self.total_ms():.1f}")
+        return ", ".join(metrics)
+
+    def sample(self) -> Dict[str, Any]:
+        """The values persisted for one turn"""
+        sample: Dict[str, Any] = {
+            name: round(duration, 2) for name, duration in self.stages.items()
+        }
+        sample["total"] = round(self.total_ms(), 2)
+        if self.prompt_tokens is not None:
+            sample["prompt_tokens"] = self.prompt_tokens
+        return sample
+
+
+@contextmanager
+def turn_timing(timer: Optional[TurnTimer] = None) -> Iterator[TurnTimer]:
+    """Bind a timer to the current turn, reusing one the caller already bound"""
+    current = _current_timer.get()
+    if current is not None and timer is None:
+        yield current
+        return
+    timer = timer or TurnTimer()
+    token = _current_timer.set(timer)
+    try:
+        yield timer
+    finally:
+        _current_timer.reset(token)
+
+
+def current_turn_timer() -> Optional[TurnTimer]:
+    return _current_timer.get()
+
+
+@contextmanager
+def timed_stage(name: str) -> Iterator[None]:
+    """Time a stage of the current turn; a no-op outside a timed turn"""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.stage(name):
+        yield
+
+
+async def record_turn_timings(user_id: str, thread_id: str, timer: TurnTimer) -> None:
+    """Append the turn's sample to the user's and the thread's capped lists"""
+    sample = timer.sample()
+    logger.info(f"Sidekick turn timings for thread {thread_id}: {sample}")
+    client = get_redis_if_connected()
+    if client is None:
+        return
+    value = json.dumps(sample)
+    try:
+        async with client.pipeline(transaction=False) as pipe:
+            for scope, scope_id in (("user", user_id), ("thread", thread_id)):
+                key = TIMINGS_KEY.format(scope=scope, scope_id=scope_id)
+                pipe.lpush(key, value)
+                pipe.ltrim(key, 0, settings.SIDEKICK_TURN_TIMING_SAMPLES - 1)
+                pipe.expire(key, settings.SIDEKICK_TURN_TIMING_TTL)
+            await pipe.execute()
+    except RedisError as e:
+        logger.warning(f"Failed to record turn timings: {str(e)}")
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+async def get_turn_timing_stats(scope: str, scope_id: str) -> Dict[str, Any]:
+    """Count, p50 and p95 for each stage, the total and prompt tokens"""
+    stats: Dict[str, Any] = {"scope": scope, "samples": 0, "metrics": {}}
+    client = get_redis_if_connected()
+    if client is None:
+        return stats
+    try:
+        raw_samples = await client.lrange(
+            TIMINGS_KEY.format(scope=scope, scope_id=scope_id), 0, -1
+        )
+        samples = [json.loads(raw) for raw in raw_samples]
+    except (RedisError, ValueError) as e:
+        logger.warning(f"Failed to read turn timings: {str(e)}")
+        return stats
+
+    values: Dict[str, List[float]] = {}
+    for sample in samples:
+        for name, value in sample.items():
+            values.setdefault(name, []).append(float(value))
+    stats["samples"] = len(samples)
+    stats["metrics"] = {
+        name: {
+            "count": len(series),
+            "p50": round(_percentile(series, 50), 2),
+            "p95": round(_percentile(series, 95), 2),
+        }
+        for name, series in values.items()
+    }
+    return stats